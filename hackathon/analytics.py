@@ -0,0 +1,138 @@
+from threading import Lock
+
+import numpy as np
+
+from answer_keys import AnswerKey
+from gradebook import NO_ANSWER, answer_matrix
+
+OPTION_LETTERS = ("A", "B", "C", "D")
+
+class QuizAnalytics:
+    """Running per-question counters for one quiz, as arrays indexed by question position"""
+
+    def __init__(self, key: AnswerKey):
+        questions = len(key)
+        self.key = key
+        self.submissions = 0
+        self.attempts = np.zeros(questions, dtype=np.int64)
+        self.correct = np.zeros(questions, dtype=np.int64)
+        # One column per option letter plus a last column for anything else
+        self.options = np.zeros((questions, len(OPTION_LETTERS) + 1), dtype=np.int64)
+
+    def add(self, answers: list[list[str]]):
+        """Fold a batch of submissions (one answer list each) into the counters"""
+        if not answers or not len(self.key):
+            self.submissions += len(answers)
+            return
+        matrix = answer_matrix(answers, len(self.key))
+        answered = (matrix != NO_ANSWER) & (matrix != "")
+        by_letter = np.stack([(matrix == letter).sum(axis=0) for letter in OPTION_LETTERS], axis=1)
+
+        self.submissions += len(answers)
+        self.attempts += answered.sum(axis=0)
+        self.correct += (answered & (matrix == np.array(self.key.letters, dtype=str))).sum(axis=0)
+        self.options[:, :-1] += by_letter
+        self.options[:, -1] += answered.sum(axis=0) - by_letter.sum(axis=1)
+
+    def snapshot(self) -> dict:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rates = np.where(self.attempts > 0, self.correct / self.attempts, np.nan)
+        questions = [
+            {
+                "index": index,
+                "question_id": self.key.question_ids[index],
+                "correct_answer": self.key.letters[index],
+                "attempts": int(self.attempts[index]),
+                "correct": int(self.correct[index]),
+                "correct_rate": None if np.isnan(rates[index]) else round(float(rates[index]), 3),
+                "options": {
+                    **{letter: int(self.options[index, column]) for column, letter in enumerate(OPTION_LETTERS)},
+                    "other": int(self.options[index, -1])
+                }
+            }
+            for index in range(len(self.key))
+        ]
+        # Hardest first; questions nobody has attempted go last
+        attempted = np.flatnonzero(~np.isnan(rates))
+        hardest = attempted[np.argsort(rates[attempted], kind="stable")]
+        return {
+            "quiz_id": self.key.quiz_id,
+            "submissions": self.submissions,
+            "questions": questions,
+            "hardest": [int(index) for index in hardest]
+        }
+
+class AnalyticsStore:
+    """In-memory QuizAnalytics per quiz, updated as submissions are graded.
+
+    The counters live only in this process: a quiz seen for the first time (or after a
+    restart, or after its answer key changed) is rebuilt from stored submissions via
+    `rebuild`, and from then on kept current by `record`.
+
+    A rebuild reads the table while submissions are still being buffered and flushed, so
+    a row can be both stored and pending, or be flushed between the two reads. `capture`
+    opens a window before the read: it starts from the pending rows, and every submission
+    recorded until `rebuild` is added to it. `rebuild` then merges the stored rows with the
+    window by submission key, so each submission is counted exactly once.
+    """
+
+    def __init__(self):
+        self._quizzes: dict[str, QuizAnalytics] = {}
+        self._captures: dict[str, list[dict]] = {} # quiz_id -> open windows, submission key -> answers
+        self._lock = Lock()
+        self.recorded = 0
+        self.rebuilds = 0
+
+    def record(self, key: AnswerKey, answers: list[str], submission_key: str | None = None):
+        """Count one graded submission; ignored until the quiz has been built"""
+        with self._lock:
+            for window in self._captures.get(key.quiz_id, []):
+                window[submission_key] = answers
+            analytics = self._quizzes.get(key.quiz_id)
+            if analytics is None or analytics.key != key:
+                return
+            analytics.add([answers])
+            self.recorded += 1
+
+    def capture(self, quiz_id: str, pending: list[tuple[str | None, list[str]]]) -> dict:
+        """Open a rebuild window seeded with the quiz's pending (submission key, answers)"""
+        window = dict(pending)
+        with self._lock:
+            self._captures.setdefault(quiz_id, []).append(window)
+        return window
+
+    def release(self, quiz_id: str, window: dict):
+        """Close a window without rebuilding (the read failed)"""
+        with self._lock:
+            self._release(quiz_id, window)
+
+    def _release(self, quiz_id: str, window: dict):
+        windows = self._captures.get(quiz_id, [])
+        windows[:] = [open_window for open_window in windows if open_window is not window]
+        if not windows:
+            self._captures.pop(quiz_id, None)
+
+    def rebuild(self, key: AnswerKey, stored: list[tuple[str | None, list[str]]], window: dict | None = None) -> QuizAnalytics:
+        """Rebuild from stored (submission key, answers) plus whatever `window` caught"""
+        submissions = [answers for _, answers in stored]
+        with self._lock:
+            if window is not None:
+                self._release(key.quiz_id, window)
+                # Rows without a key predate submission keys and can only be in the table
+                stored_keys = {submission_key for submission_key, _ in stored} - {None}
+                submissions += [answers for submission_key, answers in window.items() if submission_key not in stored_keys]
+            analytics = QuizAnalytics(key)
+            analytics.add(submissions)
+            self._quizzes[key.quiz_id] = analytics
+            self.rebuilds += 1
+        return analytics
+
+    def get(self, quiz_id: str) -> QuizAnalytics | None:
+        return self._quizzes.get(quiz_id)
+
+    def invalidate(self, quiz_id: str):
+        with self._lock:
+            self._quizzes.pop(quiz_id, None)
+
+    def stats(self) -> dict:
+        return {"quizzes": len(self._quizzes), "recorded": self.recorded, "rebuilds": self.rebuilds}
@@ -0,0 +1,129 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from cache import TTLCache
+
+def expected_letter(correct_answer) -> str:
+    """Normalise a stored correct_answer (["B"], "b ", None, ...) to a single upper-case letter or "" """
+    if correct_answer is None:
+        return ""
+    if isinstance(correct_answer, list):
+        return str(correct_answer[0]).strip().upper() if correct_answer else ""
+    return str(correct_answer).strip().upper()
+
+@dataclass(frozen=True)
+class AnswerKey:
+    quiz_id: str
+    question_ids: tuple
+    letters: tuple[str, ...]
+
+    @classmethod
+    def from_rows(cls, quiz_id: str, rows: list[dict]) -> "AnswerKey":
+        return cls(
+            quiz_id,
+            tuple(row["id"] for row in rows),
+            tuple(expected_letter(row["correct_answer"]) for row in rows)
+        )
+
+    def __len__(self) -> int:
+        return len(self.letters)
+
+    def grade(self, answers: list[str]) -> int:
+        """Score answers positionally; extra or missing answers simply don't score"""
+        return sum(
+            1 for given, expected in zip(answers, self.letters)
+            if given.strip().upper() == expected
+        )
+
+class AnswerKeyCache:
+    """Compiled answer keys per quiz, so grading a submission needs no Q&A query.
+
+    `fetch(quiz_id)` returns the quiz's Q&A rows (id, correct_answer) and runs at most once
+    per quiz at a time; `fetch_many(quiz_ids)` does the same for several quizzes in one query
+    (rows also carry quiz_id): when a whole class submits at once, the first miss loads the key and
+    everyone else awaits the same result. Keys are put on quiz creation and must be
+    invalidated when questions are edited.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[list[dict]]],
+        fetch_many: Callable[[list[str]], Awaitable[list[dict]]] | None = None,
+        maxsize: int = 2048,
+        ttl: float = 3600.0
+    ):
+        self._fetch = fetch
+        self._fetch_many = fetch_many
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._loading: dict[str, asyncio.Future] = {}
+        self._invalidations = 0
+        self.builds = 0
+
+    async def get(self, quiz_id: str) -> AnswerKey | None:
+        """The quiz's answer key, or None if it has no questions"""
+        key = self._cache.get(quiz_id)
+        if key is not None:
+            return key
+
+        loading = self._loading.get(quiz_id)
+        if loading is None:
+            loading = self._loading[quiz_id] = asyncio.ensure_future(self._load(quiz_id))
+            loading.add_done_callback(lambda done: self._forget_load(quiz_id, done))
+        # Shielded so one cancelled request doesn't fail the others waiting on the same load
+        return await asyncio.shield(loading)
+
+    async def get_many(self, quiz_ids: list[str]) -> dict[str, AnswerKey]:
+        """Answer keys by quiz id; quizzes without questions are left out"""
+        keys = {}
+        missing = []
+        for quiz_id in dict.fromkeys(quiz_ids):
+            key = self._cache.get(quiz_id)
+            if key is not None:
+                keys[quiz_id] = key
+            else:
+                missing.append(quiz_id)
+        if not missing:
+            return keys
+
+        if self._fetch_many is None:
+            loaded = await asyncio.gather(*(self.get(quiz_id) for quiz_id in missing))
+            keys.update((quiz_id, key) for quiz_id, key in zip(missing, loaded) if key is not None)
+            return keys
+
+        invalidations = self._invalidations
+        rows_by_quiz: dict[str, list[dict]] = {}
+        for row in await self._fetch_many(missing):
+            rows_by_quiz.setdefault(row["quiz_id"], []).append(row)
+        # A paged read can straddle an edit; if any key was invalidated meanwhile, use these once but don't cache
+        cache = self._invalidations == invalidations
+        for quiz_id, rows in rows_by_quiz.items():
+            keys[quiz_id] = self.put(quiz_id, rows) if cache else AnswerKey.from_rows(quiz_id, rows)
+        return keys
+
+    async def _load(self, quiz_id: str) -> AnswerKey | None:
+        rows = await self._fetch(quiz_id)
+        if not rows:
+            return None
+        if self._loading.get(quiz_id) is not asyncio.current_task():
+            # Invalidated mid-load: the rows may predate the edit, so use them once but don't cache
+            return AnswerKey.from_rows(quiz_id, rows)
+        return self.put(quiz_id, rows)
+
+    def _forget_load(self, quiz_id: str, done: asyncio.Future):
+        if self._loading.get(quiz_id) is done:
+            del self._loading[quiz_id]
+
+    def put(self, quiz_id: str, rows: list[dict]) -> AnswerKey:
+        self.builds += 1
+        key = AnswerKey.from_rows(quiz_id, rows)
+        self._cache.set(quiz_id, key)
+        return key
+
+    def invalidate(self, quiz_id: str):
+        self._invalidations += 1
+        self._cache.pop(quiz_id)
+        self._loading.pop(quiz_id, None)
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "builds": self.builds, "loading": len(self._loading)}
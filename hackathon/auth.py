@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import time
+from dataclasses import dataclass, field
+
+import httpx
+import jwt
+
+from cache import TTLCache
+
+@dataclass
+class AuthUser:
+    id: str
+    email: str | None = None
+    created_at: str | None = None
+    claims: dict = field(default_factory=dict)
+
+class TokenVerifier:
+    """Verifies Supabase access tokens locally, with the remote get_user call as an opt-in fallback.
+
+    mode="local"  - check the JWT signature/claims here (HS256 secret or the project's JWKS)
+    mode="remote" - always ask Supabase via supabase.auth.get_user
+    remote_fallback=True lets "local" mode fall back to Supabase when no signing key is usable.
+    """
+
+    HMAC_ALGORITHMS = ["HS256"]
+    ASYMMETRIC_ALGORITHMS = ["RS256", "ES256", "EdDSA"]
+
+    def __init__(
+        self,
+        supabase_client,
+        supabase_url: str,
+        executor=None,
+        jwt_secret: str | None = None,
+        mode: str = "local",
+        remote_fallback: bool = False,
+        audience: str = "authenticated",
+        jwks_ttl: float = 600.0,
+        jwks_min_refresh_interval: float = 30.0,
+        cache_size: int = 4096,
+        leeway: float = 5.0
+    ):
+        if mode not in ("local", "remote"):
+            raise ValueError(f"Unknown auth mode: {mode}")
+        self.supabase = supabase_client
+        # Blocking Supabase calls go through the shared QueryExecutor when one is given
+        self._run_sync = executor.run if executor is not None else asyncio.to_thread
+        self.mode = mode
+        self.remote_fallback = remote_fallback
+        self.jwt_secret = jwt_secret
+        self.audience = audience
+        self.issuer = f"{supabase_url.rstrip('/')}/auth/v1" if supabase_url else None
+        self.jwks_url = f"{self.issuer}/.well-known/jwks.json" if self.issuer else None
+        self.jwks_ttl = jwks_ttl
+        self.jwks_min_refresh_interval = jwks_min_refresh_interval
+        self.leeway = leeway
+
+        self._jwks: dict[str, object] = {}
+        self._jwks_fetched_at = 0.0
+        self._jwks_lock = asyncio.Lock()
+        # Verified tokens keyed by sha256(token); each entry expires with its token
+        self._verified = TTLCache(maxsize=cache_size, ttl=300.0)
+
+    async def verify(self, token: str, remote: bool = False) -> AuthUser | None:
+        """Return the token's user, or None when the token is invalid or expired"""
+        cache_key = ("remote" if remote else "any", hashlib.sha256(token.encode()).hexdigest())
+        cached = self._verified.get(cache_key)
+        if cached is not None:
+            return cached
+
+        if remote or self.mode == "remote":
+            user, exp = await self._verify_remote(token)
+        else:
+            try:
+                user, exp = await self._verify_local(token)
+            except LookupError as e:
+                if not self.remote_fallback:
+                    print(f"Local token verification unavailable: {e}")
+                    return None
+                user, exp = await self._verify_remote(token)
+
+        if user is not None:
+            ttl = exp - time.time() if exp else self._verified.ttl
+            if ttl > 0:
+                self._verified.set(cache_key, user, expires_at=time.monotonic() + ttl)
+        return user
+
+    def forget(self, token: str):
+        """Drop a token from the verified cache (e.g. on logout)"""
+        digest = hashlib.sha256(token.encode()).hexdigest()
+        self._verified.pop(("any", digest))
+        self._verified.pop(("remote", digest))
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "remote_fallback": self.remote_fallback,
+            "jwks_keys": len(self._jwks),
+            "verified_cache": self._verified.stats()
+        }
+
+    # Local verification
+    async def _verify_local(self, token: str) -> tuple[AuthUser | None, float | None]:
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError:
+            return None, None
+
+        alg = header.get("alg")
+        if alg in self.HMAC_ALGORITHMS:
+            if not self.jwt_secret:
+                raise LookupError("token is HS256 but SUPABASE_JWT_SECRET is not set")
+            key = self.jwt_secret
+        elif alg in self.ASYMMETRIC_ALGORITHMS:
+            key = await self._get_signing_key(header.get("kid"))
+        else:
+            return None, None
+
+        try:
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=[alg],
+                audience=self.audience,
+                issuer=self.issuer,
+                leeway=self.leeway,
+                options={"require": ["exp", "sub"]}
+            )
+        except jwt.PyJWTError as e:
+            print(f"Token verification failed: {e}")
+            return None, None
+
+        user = AuthUser(id=claims["sub"], email=claims.get("email"), claims=claims)
+        return user, float(claims["exp"])
+
+    async def _get_signing_key(self, kid: str | None):
+        if not self.jwks_url:
+            raise LookupError("SUPABASE_URL is not set, cannot fetch JWKS")
+
+        stale = time.monotonic() - self._jwks_fetched_at > self.jwks_ttl
+        if stale or kid not in self._jwks:
+            await self._refresh_jwks(force=not stale)
+
+        key = self._jwks.get(kid)
+        if key is None:
+            raise LookupError(f"no signing key with kid {kid!r} in JWKS")
+        return key
+
+    async def _refresh_jwks(self, force: bool):
+        async with self._jwks_lock:
+            since_fetch = time.monotonic() - self._jwks_fetched_at
+            # Another request refreshed while we waited, or an unknown kid is hammering us
+            if since_fetch < self.jwks_min_refresh_interval:
+                return
+            if not force and since_fetch <= self.jwks_ttl:
+                return
+            try:
+                async with httpx.AsyncClient(timeout=5.0) as client:
+                    resp = await client.get(self.jwks_url)
+                    resp.raise_for_status()
+                    jwks = resp.json()
+            except Exception as e:
+                print(f"JWKS fetch failed: {e}")
+                if not self._jwks:
+                    raise LookupError(f"JWKS unavailable: {e}")
+                return
+
+            keys = {}
+            for jwk in jwks.get("keys", []):
+                try:
+                    keys[jwk.get("kid")] = jwt.PyJWK(jwk).key
+                except jwt.PyJWTError as e:
+                    print(f"Skipping unusable JWK {jwk.get('kid')}: {e}")
+            self._jwks = keys
+            self._jwks_fetched_at = time.monotonic()
+
+    # Remote verification
+    async def _verify_remote(self, token: str) -> tuple[AuthUser | None, float | None]:
+        try:
+            response = await self._run_sync(self.supabase.auth.get_user, token)
+        except Exception as e:
+            print(f"Remote token verification failed: {e}")
+            return None, None
+        if not response or not response.user:
+            return None, None
+
+        exp = None
+        try:
+            exp = float(jwt.decode(token, options={"verify_signature": False}).get("exp"))
+        except (jwt.PyJWTError, TypeError):
+            pass
+
+        created_at = response.user.created_at
+        user = AuthUser(
+            id=response.user.id,
+            email=response.user.email,
+            created_at=created_at.isoformat() if hasattr(created_at, "isoformat") else created_at
+        )
+        return user, exp
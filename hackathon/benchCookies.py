@@ -0,0 +1,119 @@
+"""Requests-per-second benchmark for signed-cookie handling.
+
+Compares the old BaseHTTPMiddleware that verified `access_token` on every request with the
+lazy SignedCookieReader, on a route that never reads the cookie (like /logout) and on one
+that reads it twice (dependency, then route). Requests are driven straight through the
+ASGI interface so the numbers measure the app, not an HTTP client.
+
+    python benchCookies.py
+"""
+import asyncio
+import time
+
+from fastapi import Depends, FastAPI, Request
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from cookies import SignedCookieReader
+
+MAX_AGE = 604800
+REQUESTS = 5000
+CONCURRENCY = 50
+
+serializer = URLSafeTimedSerializer("bench")
+COOKIE = f"access_token={serializer.dumps('header.payload.signature')}".encode()
+
+def build_eager_app() -> FastAPI:
+    """The previous design: verify in a BaseHTTPMiddleware before every request"""
+    class EagerSignedCookieMiddleware(BaseHTTPMiddleware):
+        async def dispatch(self, request: Request, call_next):
+            request.state.unsigned_cookies = {}
+            signed_value = request.cookies.get("access_token")
+            if signed_value:
+                try:
+                    request.state.unsigned_cookies["access_token"] = serializer.loads(signed_value, max_age=MAX_AGE)
+                except (BadSignature, SignatureExpired):
+                    request.state.unsigned_cookies["access_token"] = None
+            return await call_next(request)
+
+    def read_cookie(request: Request, key: str) -> str | None:
+        return request.state.unsigned_cookies.get(key)
+
+    app = FastAPI()
+    app.add_middleware(EagerSignedCookieMiddleware)
+    add_routes(app, read_cookie)
+    return app
+
+def build_lazy_app() -> FastAPI:
+    reader = SignedCookieReader(serializer, max_age=MAX_AGE)
+    app = FastAPI()
+    add_routes(app, reader.get)
+    return app
+
+def add_routes(app: FastAPI, read_cookie):
+    async def current_token(request: Request) -> str | None:
+        return read_cookie(request, "access_token")
+
+    @app.post("/logout")
+    async def logout():
+        return {"status": "success"}
+
+    @app.get("/user")
+    async def user(request: Request, token: str | None = Depends(current_token)):
+        return {"authenticated": token is not None and read_cookie(request, "access_token") == token}
+
+async def call(app: FastAPI, method: str, path: str) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench"), (b"cookie", COOKIE)],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80)
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+async def requests_per_second(app: FastAPI, method: str, path: str) -> float:
+    assert await call(app, method, path) == 200
+    remaining = REQUESTS
+
+    async def client():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            await call(app, method, path)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(CONCURRENCY)))
+    return REQUESTS / (time.perf_counter() - started)
+
+async def run():
+    apps = {"eager middleware": build_eager_app(), "lazy reader": build_lazy_app()}
+    print(f"{REQUESTS} requests, {CONCURRENCY} concurrent")
+    print(f"{'route':<14} {'design':<18} {'req/s':>10}")
+    for method, path in (("POST", "/logout"), ("GET", "/user")):
+        results = {}
+        for name, app in apps.items():
+            results[name] = await requests_per_second(app, method, path)
+            print(f"{method + ' ' + path:<14} {name:<18} {results[name]:>10.0f}")
+        print(f"{'':<14} {'speedup':<18} {results['lazy reader'] / results['eager middleware']:>9.2f}x")
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,152 @@
+"""Routing and failover check for OllamaPool against local stand-in Ollama servers.
+
+Starts stand-ins that speak just enough of the Ollama HTTP API (/api/tags, /api/ps and a
+streaming /api/generate) plus one address with nothing listening, then:
+
+  1. probes, and expects the dead host to be marked down and only the warm host to be ready,
+  2. warms the model and expects it resident on both live hosts,
+  3. runs concurrent generations and expects them split across the live hosts,
+  4. marks the dead host healthy (a stale probe) and expects calls to fail over to a live one,
+  5. puts a host that accepts calls but never streams first and expects a failover after
+     `request_timeout`.
+
+    python benchOllamaPool.py
+"""
+import asyncio
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ollama_pool import OllamaPool
+
+MODEL = "bench-model"
+CHUNKS = 10
+CHUNK_DELAY = 0.01 # Seconds between streamed chunks
+REQUESTS = 40
+STALL_SECONDS = 3 # How long the stalled stand-in holds a call without answering
+REQUEST_TIMEOUT = 0.5
+
+def make_handler(name: str, loaded: bool, stall: bool = False):
+    state = {"loaded": loaded}
+
+    class StandInOllama(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _json(self, body: dict):
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            model = {"model": MODEL, "name": MODEL, "size": 1, "digest": "0"}
+            if self.path == "/api/tags":
+                self._json({"models": [model]})
+            elif self.path == "/api/ps":
+                self._json({"models": [model] if state["loaded"] else []})
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if stall:
+                time.sleep(STALL_SECONDS)
+                return
+            state["loaded"] = True
+            if not request.get("stream", True):
+                # Warm-up calls: an empty prompt only loads the model
+                self._json({"model": MODEL, "response": "", "done": True})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for index in range(CHUNKS):
+                time.sleep(CHUNK_DELAY)
+                self.wfile.write((json.dumps({"model": MODEL, "response": f"{name}:{index} ", "done": False}) + "\n").encode())
+                self.wfile.flush()
+            final = {"model": MODEL, "response": "", "done": True, "eval_count": CHUNKS, "eval_duration": int(CHUNKS * CHUNK_DELAY * 1e9)}
+            self.wfile.write((json.dumps(final) + "\n").encode())
+            self.wfile.flush()
+
+    return StandInOllama
+
+def start_stand_in(name: str, loaded: bool = True, stall: bool = False) -> tuple[ThreadingHTTPServer, str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(name, loaded, stall))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def unused_address() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+async def collect(pool: OllamaPool) -> str:
+    text = ""
+    async for chunk in pool.generate(model=MODEL, prompt="bench"):
+        text += chunk["response"]
+    return text
+
+async def main():
+    server_a, url_a = start_stand_in("a")
+    server_b, url_b = start_stand_in("b", loaded=False)
+    dead_url = unused_address()
+    server_stalled, stalled_url = start_stand_in("stalled", stall=True)
+    pool = OllamaPool([url_a, url_b, dead_url], probe_interval=60, probe_timeout=1)
+    await pool.start()
+    try:
+        health = {backend.url: backend.healthy for backend in pool.backends}
+        print(f"After probe: {health}")
+        assert health == {url_a: True, url_b: True, dead_url: False}
+        assert pool.resident(MODEL) == [url_a]
+
+        warmed = await pool.warm(MODEL)
+        print(f"Warmed {MODEL} on {warmed} host(s); resident on {pool.resident(MODEL)}")
+        assert pool.resident(MODEL) == [url_a, url_b]
+
+        started = time.perf_counter()
+        texts = await asyncio.gather(*(collect(pool) for _ in range(REQUESTS)))
+        elapsed = time.perf_counter() - started
+        served = {name: sum(1 for text in texts if text.startswith(f"{name}:")) for name in ("a", "b")}
+        print(f"{REQUESTS} concurrent generations in {elapsed:.2f}s, served by {served}")
+        assert all(len(text.split()) == CHUNKS for text in texts)
+        assert abs(served["a"] - served["b"]) <= REQUESTS // 4, "load was not spread across the live hosts"
+
+        # A probe result gone stale: the dead host looks healthy, idle and warm, so it is picked first
+        dead = pool.backends[2]
+        dead.healthy = True
+        dead.loaded_models = {MODEL}
+        texts = await asyncio.gather(*(collect(pool) for _ in range(5)))
+        print(f"Failovers after a stale probe: {pool.failovers}; dead host healthy={dead.healthy}")
+        assert pool.failovers >= 1 and not dead.healthy
+        assert all(len(text.split()) == CHUNKS for text in texts)
+
+        # A host that accepts the call and then hangs; both start healthy and cold, so it is picked first
+        stalled = OllamaPool([stalled_url, url_a], request_timeout=REQUEST_TIMEOUT)
+        started = time.perf_counter()
+        text = await collect(stalled)
+        elapsed = time.perf_counter() - started
+        print(f"Stalled host failed over in {elapsed:.2f}s; stalled host healthy={stalled.backends[0].healthy}")
+        assert stalled.failovers == 1 and not stalled.backends[0].healthy
+        assert len(text.split()) == CHUNKS and elapsed < STALL_SECONDS
+
+        for backend in pool.stats()["backends"]:
+            print(
+                f"  {backend['url']}: healthy={backend['healthy']} requests={backend['requests']} "
+                f"failures={backend['failures']} avg_latency_ms={backend['avg_latency_ms']} "
+                f"tokens_per_second={backend['tokens_per_second']}"
+            )
+        assert all(backend.eval_seconds > 0 for backend in pool.backends[:2])
+        print("OK")
+    finally:
+        await pool.shutdown()
+        server_a.shutdown()
+        server_b.shutdown()
+        server_stalled.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
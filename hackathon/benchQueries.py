@@ -0,0 +1,127 @@
+"""Query-count regression benchmark for the classroom routes.
+
+Runs the route handlers against an in-memory stand-in for the Supabase client that records
+every PostgREST query and sleeps for a simulated round-trip. Fails if the number of queries
+grows with the number of rows.
+
+With a 5 ms round-trip, GET /classrooms went from 2/11/31/101 queries (11/60/170/567 ms)
+for 1/10/30/100 memberships with per-teacher profile reads to 2 queries (~11 ms) throughout.
+
+    python benchQueries.py
+"""
+import asyncio
+import os
+import re
+import time
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "bench.bench.bench")
+os.environ.setdefault("SECRET_KEY", "bench")
+
+import main
+from auth import AuthUser
+
+ROUND_TRIP_SECONDS = 0.005
+EMBED_PATTERN = re.compile(r"(\w+):(\w+)\s*\(")
+
+class FakeResult:
+    def __init__(self, data):
+        self.data = data
+
+class FakeQuery:
+    def __init__(self, client: "FakeSupabase", table: str):
+        self.client = client
+        self.table_name = table
+        self.columns = "*"
+        self.filters = []
+        self.is_single = False
+        self.row_limit = None
+
+    def select(self, columns: str = "*"):
+        self.columns = columns
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def limit(self, n):
+        self.row_limit = n
+        return self
+
+    def single(self):
+        self.is_single = True
+        return self
+
+    def execute(self):
+        self.client.queries.append(self.table_name)
+        time.sleep(ROUND_TRIP_SECONDS)
+
+        rows = [dict(row) for row in self.client.tables.get(self.table_name, []) if all(f(row) for f in self.filters)]
+        for alias, fk in EMBED_PATTERN.findall(self.columns):
+            targets = {target["id"]: target for target in self.client.tables.get(alias, [])}
+            for row in rows:
+                row[alias] = targets.get(row.get(fk))
+        if self.row_limit is not None:
+            rows = rows[:self.row_limit]
+        if self.is_single:
+            return FakeResult(rows[0] if rows else None)
+        return FakeResult(rows)
+
+class FakeSupabase:
+    def __init__(self, tables: dict[str, list[dict]]):
+        self.tables = tables
+        self.queries: list[str] = []
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+def build_tables(n_classrooms: int) -> dict[str, list[dict]]:
+    student = {"id": "student", "first_name": "Sam", "last_name": "Student", "image_url": "", "pronouns": "they/them"}
+    teachers = [
+        {"id": f"teacher-{i}", "first_name": f"T{i}", "last_name": "Teacher", "image_url": "", "pronouns": "they/them"}
+        for i in range(n_classrooms)
+    ]
+    classrooms = [
+        {"id": f"class-{i}", "name": f"Class {i}", "created_at": f"2025-01-{i % 28 + 1:02d}", "teacher_id": f"teacher-{i}"}
+        for i in range(n_classrooms)
+    ]
+    members = [
+        {"id": f"m-{i}", "classroom_id": f"class-{i}", "user_id": "student", "role": "student", "joined_at": f"2025-02-{i % 28 + 1:02d}"}
+        for i in range(n_classrooms)
+    ]
+    return {"clientProfile": [student, *teachers], "classroom": classrooms, "classroom_members": members}
+
+async def bench_get_my_classrooms(sizes=(1, 10, 30, 100)) -> list[int]:
+    counts = []
+    print("GET /classrooms")
+    print(f"{'memberships':>12} {'queries':>8} {'ms':>8}")
+    for n in sizes:
+        fake = FakeSupabase(build_tables(n))
+        main.supabase = fake
+        # Measure the cold path; a warm profile cache would hide a per-row query
+        main.profile_cache.clear()
+        started = time.perf_counter()
+        result = await main.get_my_classrooms(user=AuthUser(id="student"))
+        elapsed = (time.perf_counter() - started) * 1000
+        assert len(result["classrooms"]) == n
+        counts.append(len(fake.queries))
+        print(f"{n:>12} {len(fake.queries):>8} {elapsed:>8.1f}")
+    return counts
+
+async def run():
+    counts = await bench_get_my_classrooms()
+    assert len(set(counts)) == 1, f"GET /classrooms query count grows with memberships: {counts}"
+    print("OK: query count is constant")
+    main.db.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,61 @@
+import hashlib
+import time
+
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from starlette.requests import HTTPConnection
+
+from cache import TTLCache
+
+class SignedCookieReader:
+    """Verifies signed cookies lazily, only for routes that ask for them.
+
+    The first read of a cookie in a request verifies it and memoizes the result on
+    `request.state`, so later reads in the same request (dependency, then route) are free.
+    Successful verifications are also kept in a small LRU keyed by the cookie's hash until
+    the signature's max_age runs out, so a client sending the same cookie on every request
+    pays for the HMAC once.
+    """
+
+    def __init__(self, serializer: URLSafeTimedSerializer, max_age: int, cache_size: int = 4096):
+        self.serializer = serializer
+        self.max_age = max_age
+        self._verified = TTLCache(maxsize=cache_size, ttl=max_age)
+        self.verifications = 0
+        self.failures = 0
+
+    def get(self, request: HTTPConnection, key: str) -> str | None:
+        memo = getattr(request.state, "unsigned_cookies", None)
+        if memo is None:
+            memo = request.state.unsigned_cookies = {}
+        if key not in memo:
+            memo[key] = self._verify(key, request.cookies.get(key))
+        return memo[key]
+
+    def _verify(self, key: str, signed_value: str | None) -> str | None:
+        if not signed_value:
+            return None
+
+        cache_key = hashlib.sha256(signed_value.encode()).digest()
+        value = self._verified.get(cache_key)
+        if value is not None:
+            return value
+
+        self.verifications += 1
+        try:
+            value, signed_at = self.serializer.loads(signed_value, max_age=self.max_age, return_timestamp=True)
+        except (BadSignature, SignatureExpired) as e:
+            self.failures += 1
+            print(f"Cookie verification failed for {key}: {e}")
+            return None
+
+        remaining = signed_at.timestamp() + self.max_age - time.time()
+        if remaining > 0:
+            self._verified.set(cache_key, value, ttl=remaining)
+        return value
+
+    def stats(self) -> dict:
+        return {
+            **self._verified.stats(),
+            "verifications": self.verifications,
+            "failures": self.failures
+        }
@@ -0,0 +1,112 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from fastapi import HTTPException
+
+class QueryExecutor:
+    """Runs blocking Supabase/PostgREST calls on a bounded thread pool so the event loop stays free"""
+
+    def __init__(self, max_workers: int = 16, name: str = "supabase", default_timeout: float | None = None):
+        self.max_workers = max_workers
+        self.default_timeout = default_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-db")
+        self._lock = Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.running = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+        self.max_wait = 0.0
+        self.max_run = 0.0
+
+    async def execute(self, query, timeout: float | None = None):
+        """Await a query builder, e.g. `await db.execute(supabase.table("quizzes").select("*"))`.
+
+        Raises a 504 HTTPException if the query takes longer than `timeout` (or the default).
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        if not timeout:
+            return await self.run(query.execute)
+        try:
+            return await asyncio.wait_for(self.run(query.execute), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise HTTPException(status_code=504, detail="Database query timed out")
+
+    async def fetch_all(self, build_query, page_size: int = 1000, timeout: float | None = None) -> list:
+        """Every row of a read that may exceed PostgREST's per-response cap (max-rows).
+
+        `build_query()` must return a fresh, totally ordered builder (e.g. `.order("id")`) on
+        each call; pages are requested with `.range` until one comes back short, so
+        `page_size` must not be larger than the server's max-rows.
+        """
+        rows = []
+        while True:
+            result = await self.execute(build_query().range(len(rows), len(rows) + page_size - 1), timeout=timeout)
+            rows.extend(result.data)
+            if len(result.data) < page_size:
+                return rows
+
+    async def gather(self, *queries, timeout: float | None = None) -> list:
+        """Run independent queries concurrently; latency is that of the slowest one"""
+        return list(await asyncio.gather(*(self.execute(query, timeout=timeout) for query in queries)))
+
+    async def run(self, fn, *args, **kwargs):
+        """Run any blocking callable (auth calls, RPCs, ...) on the pool"""
+        loop = asyncio.get_running_loop()
+        enqueued_at = time.perf_counter()
+        with self._lock:
+            self.submitted += 1
+        return await loop.run_in_executor(
+            self._pool, functools.partial(self._call, enqueued_at, fn, args, kwargs)
+        )
+
+    def _call(self, enqueued_at: float, fn, args, kwargs):
+        started_at = time.perf_counter()
+        waited = started_at - enqueued_at
+        with self._lock:
+            self.running += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            ran = time.perf_counter() - started_at
+            with self._lock:
+                self.running -= 1
+                self.total_run += ran
+                self.max_run = max(self.max_run, ran)
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "max_workers": self.max_workers,
+                "running": self.running,
+                "queued": self.submitted - finished - self.running,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait / finished * 1000, 2) if finished else 0.0,
+                "avg_run_ms": round(self.total_run / finished * 1000, 2) if finished else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+                "max_run_ms": round(self.max_run * 1000, 2)
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
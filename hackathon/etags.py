@@ -0,0 +1,19 @@
+import hashlib
+
+from fastapi import Request
+
+def make_etag(*parts) -> str:
+    """A strong ETag over everything the response depends on (DB revision, caller, query string)"""
+    digest = hashlib.sha256("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+def not_modified(request: Request, etag: str) -> bool:
+    """True when the request's If-None-Match already names `etag`"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so a W/ prefix added by a proxy still matches
+    candidates = (tag.strip().removeprefix("W/") for tag in header.split(","))
+    return etag in candidates
@@ -0,0 +1,52 @@
+import numpy as np
+
+from answer_keys import AnswerKey
+
+# Pads rows shorter than the key; never equal to a normalised answer, so it never scores
+NO_ANSWER = "￿"
+
+def answer_matrix(answers: list[list[str]], width: int) -> np.ndarray:
+    """Normalised answers as a (submissions x width) string array, padded or cut to `width`"""
+    rows = [
+        [str(given).strip().upper() for given in submitted[:width]] + [NO_ANSWER] * (width - len(submitted[:width]))
+        for submitted in answers
+    ]
+    return np.array(rows, dtype=str).reshape(len(rows), width)
+
+def grade(key: AnswerKey, answers: list[list[str]]) -> np.ndarray:
+    """Boolean (submissions x questions) matrix of correct answers; scores are `.sum(axis=1)`.
+
+    Matches AnswerKey.grade: answers are compared positionally after strip/upper, and
+    extra answers are ignored.
+    """
+    expected = np.array(key.letters, dtype=str)
+    if not len(answers) or not len(expected):
+        return np.zeros((len(answers), len(expected)), dtype=bool)
+    return answer_matrix(answers, len(expected)) == expected
+
+def score_stats(scores: np.ndarray, correct: np.ndarray) -> dict:
+    questions = correct.shape[1]
+    if not len(scores):
+        return {"submissions": 0, "questions": questions, "mean": None, "median": None, "min": None, "max": None, "question_correct_rate": [None] * questions}
+    return {
+        "submissions": int(len(scores)),
+        "questions": questions,
+        "mean": round(float(scores.mean()), 3),
+        "median": float(np.median(scores)),
+        "min": int(scores.min()),
+        "max": int(scores.max()),
+        "question_correct_rate": [round(float(rate), 3) for rate in correct.mean(axis=0)]
+    }
+
+def changed_scores(ids: list, stored: list, scores: np.ndarray) -> dict[int, list]:
+    """Ids whose stored score differs from `scores`, grouped by the new score.
+
+    Grouping lets a re-grade write back with one `UPDATE ... WHERE id IN (...)` per distinct
+    score (at most questions + 1) instead of one per submission.
+    """
+    stored = np.array([-1 if score is None else score for score in stored], dtype=np.int64)
+    changed = np.flatnonzero(stored != scores)
+    groups: dict[int, list] = {}
+    for index in changed:
+        groups.setdefault(int(scores[index]), []).append(ids[index])
+    return groups
@@ -0,0 +1,246 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from threading import Lock
+
+from fastapi import HTTPException
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL_STATES = {SUCCEEDED, FAILED, CANCELLED}
+
+class JobContext:
+    """Handed to the job handler so it can report progress"""
+
+    def __init__(self, queue: "JobQueue", job_id: str):
+        self._queue = queue
+        self.job_id = job_id
+
+    async def update(self, progress: float, stage: str):
+        await self._queue._write(
+            "UPDATE jobs SET progress = ?, stage = ?, updated_at = ? WHERE id = ?",
+            (round(min(max(progress, 0.0), 1.0), 3), stage, time.time(), self.job_id)
+        )
+
+class JobQueue:
+    """Persistent background job queue: SQLite holds job state, asyncio workers run the handler.
+
+    Jobs still queued (or interrupted mid-run) when the process stops are picked up again
+    on the next start. The SQLite file is owned by a single app process.
+    """
+
+    def __init__(self, db_path: str, upload_dir: str, handler, workers: int = 2):
+        self.db_path = db_path
+        self.upload_dir = upload_dir
+        self.handler = handler
+        self.workers = workers
+        self._conn: sqlite3.Connection | None = None
+        self._lock = Lock()
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._running: dict[str, asyncio.Task] = {}
+        self._worker_tasks: list[asyncio.Task] = []
+        self._stopping = False
+
+    # Lifecycle
+    async def start(self):
+        os.makedirs(self.upload_dir, exist_ok=True)
+        if os.path.dirname(self.db_path):
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        await self._write("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT,
+                progress REAL NOT NULL DEFAULT 0,
+                filename TEXT,
+                upload_path TEXT,
+                params TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        # Anything that was mid-run when we last stopped goes back on the queue
+        await self._write(
+            "UPDATE jobs SET status = ?, stage = ?, progress = 0, updated_at = ? WHERE status = ?",
+            (QUEUED, "requeued after restart", time.time(), RUNNING)
+        )
+        pending = await self._read("SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,))
+        for row in pending:
+            self._queue.put_nowait(row["id"])
+        if pending:
+            print(f"Resuming {len(pending)} queued job(s)")
+
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def shutdown(self, timeout: float = 30.0):
+        """Stop taking new work, give running jobs `timeout` seconds, then requeue the rest"""
+        self._stopping = True
+        running = list(self._running.values())
+        if running:
+            print(f"Draining {len(running)} running job(s)")
+            _, pending = await asyncio.wait(running, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            # Let the workers record the interrupted jobs as queued before we close SQLite
+            while self._running:
+                await asyncio.sleep(0.05)
+
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # Public API
+    async def submit(self, user_id: str, upload, params: dict) -> str:
+        """Queue a job; `upload` is an uploads.IngestedUpload whose bytes are handed over to the queue"""
+        if self._stopping:
+            raise HTTPException(status_code=503, detail="Server is shutting down, please retry shortly")
+
+        job_id = str(uuid.uuid4())
+        upload_path = os.path.join(self.upload_dir, job_id)
+        os.makedirs(self.upload_dir, exist_ok=True)
+        await asyncio.to_thread(upload.persist_to, upload_path)
+
+        now = time.time()
+        await self._write(
+            """INSERT INTO jobs (id, user_id, status, stage, progress, filename, upload_path, params, created_at, updated_at)
+               VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?, ?)""",
+            (job_id, user_id, QUEUED, "queued", upload.filename, upload_path, json.dumps(params), now, now)
+        )
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    async def get(self, job_id: str) -> dict | None:
+        rows = await self._read("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        job = dict(rows[0])
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["queue_position"] = self._position(job_id) if job["status"] == QUEUED else None
+        return job
+
+    async def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; returns False if it had already finished"""
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+            return True
+        cursor = await self._write(
+            "UPDATE jobs SET status = ?, stage = ?, updated_at = ? WHERE id = ? AND status = ?",
+            (CANCELLED, "cancelled", time.time(), job_id, QUEUED)
+        )
+        if cursor.rowcount == 0:
+            return False
+        # It will never run, so its spooled upload is no longer needed
+        rows = await self._read("SELECT upload_path FROM jobs WHERE id = ?", (job_id,))
+        if rows and rows[0]["upload_path"]:
+            self._remove_upload(rows[0]["upload_path"])
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "running": len(self._running),
+            "stopping": self._stopping
+        }
+
+    # Worker
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            if self._stopping:
+                # Leave it queued in SQLite for the next start
+                continue
+
+            cursor = await self._write(
+                "UPDATE jobs SET status = ?, stage = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, "starting", time.time(), job_id, QUEUED)
+            )
+            if cursor.rowcount == 0:
+                continue # Cancelled while it waited
+
+            job = await self.get(job_id)
+            task = asyncio.create_task(self.handler(job, JobContext(self, job_id)))
+            self._running[job_id] = task
+            try:
+                result = await asyncio.shield(task)
+                await self._finish(job, SUCCEEDED, result=result)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    # The worker itself is being torn down, not the job
+                    task.cancel()
+                    raise
+                if self._stopping:
+                    await self._write(
+                        "UPDATE jobs SET status = ?, stage = ?, progress = 0, updated_at = ? WHERE id = ?",
+                        (QUEUED, "interrupted by shutdown", time.time(), job_id)
+                    )
+                else:
+                    await self._finish(job, CANCELLED)
+            except HTTPException as e:
+                await self._finish(job, FAILED, error=str(e.detail))
+            except Exception as e:
+                print(f"Job {job_id} failed: {e}")
+                await self._finish(job, FAILED, error=str(e))
+            finally:
+                self._running.pop(job_id, None)
+
+    async def _finish(self, job: dict, status: str, result: dict | None = None, error: str | None = None):
+        await self._write(
+            "UPDATE jobs SET status = ?, stage = ?, progress = COALESCE(?, progress), result = ?, error = ?, updated_at = ? WHERE id = ?",
+            (
+                status,
+                status,
+                1.0 if status == SUCCEEDED else None,
+                json.dumps(result) if result is not None else None,
+                error,
+                time.time(),
+                job["id"]
+            )
+        )
+        if job.get("upload_path"):
+            self._remove_upload(job["upload_path"])
+
+    @staticmethod
+    def _remove_upload(upload_path: str):
+        try:
+            os.unlink(upload_path)
+        except FileNotFoundError:
+            pass
+
+    def _position(self, job_id: str) -> int | None:
+        try:
+            return list(self._queue._queue).index(job_id) + 1
+        except ValueError:
+            return None
+
+    # SQLite access, kept off the event loop
+    async def _write(self, sql: str, params: tuple = ()):
+        return await asyncio.to_thread(self._execute, sql, params, True)
+
+    async def _read(self, sql: str, params: tuple = ()) -> list[sqlite3.Row]:
+        return await asyncio.to_thread(self._execute, sql, params, False)
+
+    def _execute(self, sql: str, params: tuple, commit: bool):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            if commit:
+                self._conn.commit()
+                return cursor
+            return cursor.fetchall()
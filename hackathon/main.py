@@ -1,52 +1,205 @@
 from multiprocessing.dummy import Array
 import os
+import asyncio
+import time
 from pickletools import optimize
-import tempfile
 import json
-import io
-from uuid import UUID
+from uuid import UUID, uuid4
 from pyparsing import Opt
 from requests import get
-from fastapi import FastAPI, File, UploadFile, Response, Request, Cookie, HTTPException, Form, Depends, Body
+from fastapi import FastAPI, File, UploadFile, Response, Request, Cookie, HTTPException, Form, Depends, Body, Query
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
-from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
-import ollama
+from fastapi.responses import StreamingResponse
+from itsdangerous import URLSafeTimedSerializer
 from supabase import create_client, Client
 from pydantic import BaseModel
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import dotenv
 from typing import List
+from analytics import AnalyticsStore
+from answer_keys import AnswerKey, AnswerKeyCache
+from auth import AuthUser, TokenVerifier
+from cache import TTLCache
+from cookies import SignedCookieReader
+from db import QueryExecutor
+from etags import make_etag, not_modified
+from gradebook import changed_scores, grade, score_stats
+from jobs import JobContext, JobQueue
+from membership import ClassroomMember, MembershipCache
+from ollama_pool import OllamaPool
+from pagination import keyset, page, parse_include
+from pdf_extract import PdfExtractor, parse_page_ranges
+from profiles import PROFILE_FIELDS, ProfileCache
+from question_bank import QuestionBank, ReusePlan, normalize
+from quiz_cache import QuizCache
+from scheduler import BACKGROUND, BULK, INTERACTIVE, LLMScheduler
+from submissions import SubmissionBuffer
+from tiering import GenerationClock, ModelChoice, ModelSelector, ModelTier
+from uploads import IngestedUpload, UploadSizeLimitMiddleware, ingest_upload
+from warmup import ModelWarmer, parse_keep_alive, parse_range
+from quizgen import (
+    QUIZ_MODEL,
+    PROMPT_VERSION,
+    ParseYield,
+    QuestionSelector,
+    QuestionStreamParser,
+    build_prompt,
+    estimate_tokens,
+    pick_sections,
+    quiz_schema,
+    section_quotas,
+    split_into_sections
+)
 dotenv.load_dotenv()
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 SECRET_KEY = os.environ.get("SECRET_KEY") # CHANGE THIS TO A SECURE RANDOM STRING IN PRODUCTION
 COOKIE_MAX_AGE = int(os.environ.get("COOKIE_MAX_AGE", 604800)) # 7 days
+SUPABASE_JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET") # Legacy HS256 projects; asymmetric keys come from the JWKS
+AUTH_MODE = os.environ.get("AUTH_MODE", "local") # "local" verifies JWTs here, "remote" calls supabase.auth.get_user
+AUTH_REMOTE_FALLBACK = os.environ.get("AUTH_REMOTE_FALLBACK", "false").lower() == "true"
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 16)) # Threads available for blocking Supabase calls
+DB_QUERY_TIMEOUT = float(os.environ.get("DB_QUERY_TIMEOUT", 10)) # Seconds before a single query gives up with a 504
+DB_PAGE_SIZE = int(os.environ.get("DB_PAGE_SIZE", 1000)) # Rows per page for bulk reads; must not exceed PostgREST's max-rows
+DATA_DIR = os.environ.get("DATA_DIR", "data") # Local state: job queue, caches, logs
+QUIZ_JOB_WORKERS = int(os.environ.get("QUIZ_JOB_WORKERS", 2))
+JOB_DRAIN_TIMEOUT = float(os.environ.get("JOB_DRAIN_TIMEOUT", 30)) # Seconds running jobs get to finish on shutdown
+QUIZ_CACHE_TTL = float(os.environ.get("QUIZ_CACHE_TTL", 7 * 24 * 3600)) # 7 days
+QUIZ_CACHE_MAX_ENTRIES = int(os.environ.get("QUIZ_CACHE_MAX_ENTRIES", 5000))
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+PDF_PAGES_PER_CHUNK = int(os.environ.get("PDF_PAGES_PER_CHUNK", 8))
+PDF_MAX_PAGE = int(os.environ.get("PDF_MAX_PAGE", 5000)) # Highest page number a `pages` field may name
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 50 * 1024 * 1024)) # 50 MB
+UPLOAD_SPOOL_THRESHOLD = int(os.environ.get("UPLOAD_SPOOL_THRESHOLD", 1024 * 1024)) # Larger uploads are spooled to disk
+UPLOAD_SPOOL_DIR = os.path.join(DATA_DIR, "uploads")
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", 2)) # Ollama calls allowed to run at once across all users
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", 32)) # Interactive calls waiting beyond this get a 503
+OLLAMA_HOSTS = [host.strip() for host in os.environ.get("OLLAMA_HOSTS", os.environ.get("OLLAMA_HOST", "http://localhost:11434")).split(",") if host.strip()]
+OLLAMA_PROBE_INTERVAL = float(os.environ.get("OLLAMA_PROBE_INTERVAL", 15)) # Seconds between health / loaded-model probes
+OLLAMA_PROBE_TIMEOUT = float(os.environ.get("OLLAMA_PROBE_TIMEOUT", 3)) # A host slower than this to answer a probe is marked down
+OLLAMA_REQUEST_TIMEOUT = float(os.environ.get("OLLAMA_REQUEST_TIMEOUT", 120)) or None # Longest wait for a host to send the first (or next) chunk; 0 waits forever
+OLLAMA_KEEP_ALIVE = parse_keep_alive(os.environ.get("OLLAMA_KEEP_ALIVE", "30m")) # How long a host keeps the model loaded after each call
+KEEP_WARM_INTERVAL = float(os.environ.get("KEEP_WARM_INTERVAL", 300)) # Seconds between keep-warm pings; keep below OLLAMA_KEEP_ALIVE
+KEEP_WARM_HOURS = parse_range(os.environ.get("KEEP_WARM_HOURS", "7-19"), 0, 23) # Local hours (inclusive) to keep the model loaded
+KEEP_WARM_WEEKDAYS = parse_range(os.environ.get("KEEP_WARM_WEEKDAYS", "0-4"), 0, 6) # Monday is 0
+QUIZ_SMALL_MODEL = os.environ.get("QUIZ_SMALL_MODEL", "") # Opt-in smaller model for short documents and few questions, e.g. "gpt-oss:20b"; must be pulled on every host
+SMALL_MODEL_MAX_TOKENS = int(os.environ.get("SMALL_MODEL_MAX_TOKENS", 4000)) # Extracted text above this goes to QUIZ_MODEL
+SMALL_MODEL_MAX_QUESTIONS = int(os.environ.get("SMALL_MODEL_MAX_QUESTIONS", 10))
+SMALL_MODEL_SECONDS_PER_QUESTION = float(os.environ.get("SMALL_MODEL_SECONDS_PER_QUESTION", 1.5)) # Starting latency estimates
+LARGE_MODEL_SECONDS_PER_QUESTION = float(os.environ.get("LARGE_MODEL_SECONDS_PER_QUESTION", 6))
+EMBED_MODEL = os.environ.get("EMBED_MODEL", "nomic-embed-text") # Ollama embedding model for the question bank; empty disables the bank
+BANK_MATCH_THRESHOLD = float(os.environ.get("BANK_MATCH_THRESHOLD", 0.9)) # Cosine similarity at which a section counts as seen before
+BANK_DUPLICATE_THRESHOLD = float(os.environ.get("BANK_DUPLICATE_THRESHOLD", 0.95)) # Cosine similarity at which two questions are the same
+MODEL_BUSY_QUEUE = int(os.environ.get("MODEL_BUSY_QUEUE", max(1, LLM_MAX_QUEUE // 4))) # Queue depth at which larger requests shift to the small model
+SUBMISSION_BATCH_SIZE = int(os.environ.get("SUBMISSION_BATCH_SIZE", 200)) # Rows per bulk insert
+SUBMISSION_FLUSH_INTERVAL = float(os.environ.get("SUBMISSION_FLUSH_INTERVAL", 0.5)) # Max seconds a submission waits before it is written
+PROFILE_CACHE_SIZE = int(os.environ.get("PROFILE_CACHE_SIZE", 10000))
+PROFILE_CACHE_TTL = float(os.environ.get("PROFILE_CACHE_TTL", 600)) # Profiles rarely change and writes invalidate
+PROFILE_NEGATIVE_TTL = float(os.environ.get("PROFILE_NEGATIVE_TTL", 30)) # How long "no profile" is remembered
+MEMBERSHIP_CACHE_SIZE = int(os.environ.get("MEMBERSHIP_CACHE_SIZE", 50000))
+MEMBERSHIP_CACHE_TTL = float(os.environ.get("MEMBERSHIP_CACHE_TTL", 120)) # Bounds how long a removed member keeps access
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", 200)) # Largest `limit` the paginated classroom routes accept
+ETAGS = os.environ.get("ETAGS", "true").lower() == "true" # Needs the revision columns from migrations/004
 
 app = FastAPI()
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 serializer = URLSafeTimedSerializer(SECRET_KEY)
+signed_cookies = SignedCookieReader(serializer, max_age=COOKIE_MAX_AGE)
+db = QueryExecutor(max_workers=DB_POOL_SIZE, default_timeout=DB_QUERY_TIMEOUT)
+ollama_pool = OllamaPool(
+    OLLAMA_HOSTS,
+    probe_interval=OLLAMA_PROBE_INTERVAL,
+    probe_timeout=OLLAMA_PROBE_TIMEOUT,
+    request_timeout=OLLAMA_REQUEST_TIMEOUT,
+    keep_alive=OLLAMA_KEEP_ALIVE
+)
+pdf_extractor = PdfExtractor(max_workers=PDF_WORKERS, pages_per_chunk=PDF_PAGES_PER_CHUNK)
+extracted_text_memo = TTLCache(maxsize=64, ttl=600.0) # (upload sha256, pages) -> prompt text
+parse_yield = ParseYield()
+llm_scheduler = LLMScheduler(max_concurrency=LLM_CONCURRENCY, max_queue=LLM_MAX_QUEUE)
+model_selector = ModelSelector(
+    [
+        *([ModelTier(QUIZ_SMALL_MODEL, SMALL_MODEL_MAX_TOKENS, SMALL_MODEL_MAX_QUESTIONS, SMALL_MODEL_SECONDS_PER_QUESTION)] if QUIZ_SMALL_MODEL else []),
+        ModelTier(QUIZ_MODEL, float("inf"), float("inf"), LARGE_MODEL_SECONDS_PER_QUESTION)
+    ],
+    concurrency=LLM_CONCURRENCY,
+    busy_queue=MODEL_BUSY_QUEUE
+)
+model_warmer = ModelWarmer(
+    ollama_pool,
+    [tier.model for tier in model_selector.tiers],
+    interval=KEEP_WARM_INTERVAL,
+    hours=KEEP_WARM_HOURS,
+    weekdays=KEEP_WARM_WEEKDAYS
+)
+question_bank = QuestionBank(
+    os.path.join(DATA_DIR, "question_bank"),
+    EMBED_MODEL,
+    match_threshold=BANK_MATCH_THRESHOLD,
+    duplicate_threshold=BANK_DUPLICATE_THRESHOLD
+)
+bank_indexing: set[asyncio.Task] = set() # Background question bank inserts, referenced until done
+quiz_cache = QuizCache(
+    os.path.join(DATA_DIR, "quiz_cache.sqlite3"),
+    ttl=QUIZ_CACHE_TTL,
+    max_entries=QUIZ_CACHE_MAX_ENTRIES
+)
+async def fetch_profiles(user_ids: list[str]) -> list[dict]:
+    result = await db.execute(
+        supabase.table("clientProfile")
+        .select("id, " + ", ".join(PROFILE_FIELDS))
+        .in_("id", user_ids)
+    )
+    return result.data
 
-# Signed Cookie Middleware
-class SignedCookieMiddleware(BaseHTTPMiddleware):
-    SIGNED_COOKIE_NAMES = ["access_token"]
-    
-    async def dispatch(self, request: Request, call_next):
-        request.state.unsigned_cookies = {}
-        
-        for cookie_name in self.SIGNED_COOKIE_NAMES:
-            signed_value = request.cookies.get(cookie_name)
-            if signed_value:
-                try:
-                    unsigned_value = serializer.loads(signed_value, max_age=COOKIE_MAX_AGE)
-                    request.state.unsigned_cookies[cookie_name] = unsigned_value
-                except (BadSignature, SignatureExpired) as e:
-                    print(f"Cookie verification failed for {cookie_name}: {e}")
-                    request.state.unsigned_cookies[cookie_name] = None
-        
-        return await call_next(request)
+profile_cache = ProfileCache(
+    fetch_profiles,
+    maxsize=PROFILE_CACHE_SIZE,
+    ttl=PROFILE_CACHE_TTL,
+    negative_ttl=PROFILE_NEGATIVE_TTL
+)
+async def fetch_role(user_id: str, classroom_id: str) -> str | None:
+    result = await db.execute(
+        supabase.table("classroom_members")
+        .select("role")
+        .eq("classroom_id", classroom_id)
+        .eq("user_id", user_id)
+    )
+    return result.data[0]["role"] if result.data else None
+
+membership_cache = MembershipCache(fetch_role, maxsize=MEMBERSHIP_CACHE_SIZE, ttl=MEMBERSHIP_CACHE_TTL)
+# Grading is positional, so answer rows are always read in id order (the order questions are shown in)
+async def fetch_answer_rows(quiz_id: str) -> list[dict]:
+    return await db.fetch_all(
+        lambda: supabase.table("Q&A").select("id, correct_answer").eq("quiz_id", quiz_id).order("id"),
+        page_size=DB_PAGE_SIZE
+    )
+
+async def fetch_answer_rows_many(quiz_ids: list[str]) -> list[dict]:
+    return await db.fetch_all(
+        lambda: supabase.table("Q&A").select("id, quiz_id, correct_answer").in_("quiz_id", quiz_ids).order("id"),
+        page_size=DB_PAGE_SIZE
+    )
 
+answer_keys = AnswerKeyCache(fetch_answer_rows, fetch_many=fetch_answer_rows_many)
+quiz_analytics = AnalyticsStore()
+token_verifier = TokenVerifier(
+    supabase,
+    SUPABASE_URL,
+    executor=db,
+    jwt_secret=SUPABASE_JWT_SECRET,
+    mode=AUTH_MODE,
+    remote_fallback=AUTH_REMOTE_FALLBACK
+)
+
+# The last middleware added is the outermost: CORS must wrap the size limit so its 413s are readable
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_body_bytes=MAX_UPLOAD_BYTES + 1024 * 1024, # Headroom for the multipart framing and form fields
+    max_upload_bytes=MAX_UPLOAD_BYTES,
+    path_prefixes=("/generate-quiz",)
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["https://front.thetechtitans.vip", "https://api.thetechtitans.vip"],
@@ -55,7 +208,6 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=["*"]
 )
-app.add_middleware(SignedCookieMiddleware)
 
 # Helper functions
 def set_signed_cookie(response: Response, key: str, value: str):
@@ -74,10 +226,35 @@ def set_signed_cookie(response: Response, key: str, value: str):
     print(f"Cookie set: {key} with domain .thetechtitans.vip")
 
 def get_signed_cookie(request: Request, key: str) -> str | None:
-    value = request.state.unsigned_cookies.get(key)
+    # Verified on first use and memoized for the rest of the request
+    value = signed_cookies.get(request, key)
     print(f"Getting cookie {key}: {'Found' if value else 'Not found'}")
     return value
 
+async def get_current_user(request: Request) -> AuthUser:
+    access_token = get_signed_cookie(request, "access_token")
+    if not access_token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    user = await token_verifier.verify(access_token)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return user
+
+async def get_classroom_member(classroom_id: str, user: AuthUser = Depends(get_current_user)) -> ClassroomMember:
+    """Resolves the caller's role in the path's classroom; 403 for non-members"""
+    role = await membership_cache.get_role(user.id, classroom_id)
+    if role is None:
+        raise HTTPException(status_code=403, detail="Not a member of this classroom")
+    return ClassroomMember(user=user, classroom_id=classroom_id, role=role)
+
+async def require_classroom_teacher(classroom_id: str, user: AuthUser) -> ClassroomMember:
+    """For routes that take classroom_id from the body: 403 unless the caller teaches it"""
+    member = await get_classroom_member(classroom_id, user)
+    if not member.is_teacher:
+        raise HTTPException(status_code=403, detail="Only teachers can create quizzes in this classroom")
+    return member
+
 def clear_signed_cookie(response: Response, key: str):
     response.delete_cookie(
         key=key, 
@@ -89,29 +266,29 @@ def clear_signed_cookie(response: Response, key: str):
     )
 
 # File Processing Helper Functions
-def extract_text_from_txt(content: bytes) -> str:
+def extract_text_from_txt(upload: IngestedUpload) -> str:
     """Extract text from TXT files with multiple encoding attempts"""
     encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1', 'utf-16']
     
-    for encoding in encodings:
-        try:
-            text = content.decode(encoding)
-            print(f"Successfully decoded with {encoding}")
-            return text
-        except UnicodeDecodeError as e:
-            print(f"Failed to decode with {encoding}: {e}")
-            continue
+    with upload.mapped() as data:
+        for encoding in encodings:
+            try:
+                text = str(data, encoding)
+                print(f"Successfully decoded with {encoding}")
+                return text
+            except UnicodeDecodeError as e:
+                print(f"Failed to decode with {encoding}: {e}")
+                continue
     
     raise HTTPException(
         status_code=400, 
         detail="Could not read the text file. Please ensure it uses standard encoding (UTF-8 recommended)."
     )
 
-def extract_text_from_pdf(content: bytes) -> str:
-    """Simple PDF text extraction"""
+async def extract_text_from_pdf(upload: IngestedUpload, pages: list[int] | None = None, char_budget: int | None = None) -> str:
+    """PDF text extraction on the process pool, page range by page range"""
     try:
-        from pdfminer.high_level import extract_text as pdfminer_extract_text
-        text = pdfminer_extract_text(io.BytesIO(content))
+        text = await pdf_extractor.extract(upload.as_path(UPLOAD_SPOOL_DIR), pages=pages, char_budget=char_budget)
         if text and len(text.strip()) > 10:
             return text.strip()
         else:
@@ -123,35 +300,32 @@ def extract_text_from_pdf(content: bytes) -> str:
             detail="PDF text extraction failed. Please upload a text file (.txt) instead, or ensure the PDF contains selectable text (not scanned images)."
         )
 
-def extract_text_from_docx(content: bytes) -> str:
+def extract_text_from_docx(upload: IngestedUpload) -> str:
     """Extract text from DOCX files"""
     try:
         import docx
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp_file:
-            tmp_file.write(content)
-            tmp_file.flush()
-        
-        doc = docx.Document(tmp_file.name)
+        with upload.open() as f:
+            doc = docx.Document(f)
         text = ""
         for paragraph in doc.paragraphs:
             text += paragraph.text + "\n"
         
-        # Clean up temp file
-        os.unlink(tmp_file.name)
-        
         if not text.strip():
             raise HTTPException(status_code=400, detail="DOCX file appears to be empty")
             
         return text.strip()
     except ImportError:
         raise HTTPException(status_code=400, detail="DOCX support not available. Please install python-docx: pip install python-docx")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error reading DOCX file: {str(e)}")
 
-def extract_text_from_json(content: bytes) -> str:
+def extract_text_from_json(upload: IngestedUpload) -> str:
     """Extract text from JSON files"""
     try:
-        data = json.loads(content.decode('utf-8'))
+        with upload.mapped() as data:
+            data = json.loads(str(data, 'utf-8'))
         # Convert JSON to readable text
         if isinstance(data, dict):
             text_parts = []
@@ -165,6 +339,252 @@ def extract_text_from_json(content: bytes) -> str:
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error reading JSON file: {str(e)}")
 
+# Quiz Generation Helper Functions
+ALLOWED_EXTENSIONS = ['.txt', '.pdf', '.docx', '.json']
+MAX_DOCUMENT_CHARS = int(os.environ.get("MAX_DOCUMENT_CHARS", 400000)) # Extraction stops once this much text is collected
+SECTION_TOKENS = int(os.environ.get("SECTION_TOKENS", 2000)) # Prompt budget per map-step section
+MAP_MAX_SECTIONS = int(os.environ.get("MAP_MAX_SECTIONS", 8)) # Sections sampled across long documents
+MAP_CONCURRENCY = int(os.environ.get("MAP_CONCURRENCY", 4)) # Section generations in flight per quiz
+
+def validate_quiz_form(num_questions: int, mcq: int):
+    if num_questions < 1:
+        raise HTTPException(status_code=400, detail="Number of questions must be at least 1")
+
+    if mcq < 0 or mcq > num_questions:
+        raise HTTPException(status_code=400, detail="MCQ count must be between 0 and total questions")
+
+def check_upload_extension(filename: str) -> str:
+    file_extension = os.path.splitext(filename.lower())[1]
+    if file_extension not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"File type {file_extension} not allowed. Please use: {', '.join(ALLOWED_EXTENSIONS)}"
+        )
+    return file_extension
+
+def parse_pages_field(pages: str) -> list[int] | None:
+    try:
+        return parse_page_ranges(pages, max_page=PDF_MAX_PAGE)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid page range. Use a form like 1-5,8,10-12, with pages up to {PDF_MAX_PAGE}")
+
+async def extract_upload_text(upload: IngestedUpload, pages: list[int] | None = None) -> str:
+    """Return the upload's text, capped at MAX_DOCUMENT_CHARS"""
+    file_extension = check_upload_extension(upload.filename)
+    print(f"Processing file: {upload.filename}, Size: {upload.size} bytes, Type: {file_extension}")
+
+    # Re-uploads of the same file skip extraction entirely
+    memo_key = (upload.sha256, tuple(pages) if pages else None) if upload.sha256 else None
+    if memo_key:
+        text_content = extracted_text_memo.get(memo_key)
+        if text_content is not None:
+            return text_content
+
+    if file_extension == '.pdf':
+        text_content = await extract_text_from_pdf(upload, pages=pages, char_budget=MAX_DOCUMENT_CHARS)
+    elif file_extension == '.docx':
+        text_content = await asyncio.to_thread(extract_text_from_docx, upload)
+    elif file_extension == '.json':
+        text_content = extract_text_from_json(upload)
+    else:
+        text_content = extract_text_from_txt(upload)
+
+    if not text_content.strip():
+        raise HTTPException(status_code=400, detail="No readable text content found in the file")
+
+    print(f"Extracted text length: {len(text_content)} characters")
+
+    if len(text_content) > MAX_DOCUMENT_CHARS:
+        text_content = text_content[:MAX_DOCUMENT_CHARS]
+    if memo_key:
+        extracted_text_memo.set(memo_key, text_content)
+    return text_content
+
+async def receive_upload(file: UploadFile) -> IngestedUpload:
+    check_upload_extension(file.filename)
+    return await ingest_upload(
+        file,
+        max_bytes=MAX_UPLOAD_BYTES,
+        spool_threshold=UPLOAD_SPOOL_THRESHOLD,
+        spool_dir=UPLOAD_SPOOL_DIR
+    )
+
+async def read_upload_text(file: UploadFile, pages: str = "") -> str:
+    check_upload_extension(file.filename)
+    page_numbers = parse_pages_field(pages)
+    upload = await receive_upload(file)
+    try:
+        return await extract_upload_text(upload, pages=page_numbers)
+    finally:
+        upload.cleanup()
+
+async def stream_questions(text_content: str, mcq: int, user_id: str, priority: int = INTERACTIVE, model: str = QUIZ_MODEL, clock: GenerationClock | None = None, spare: int = 0):
+    """Yield validated questions as the model streams its schema-constrained JSON; asks for `spare` extra"""
+    parser = QuestionStreamParser()
+    clock = clock or GenerationClock()
+    completed = False
+    # Every Ollama call waits for a scheduler slot, so the GPU host only sees LLM_CONCURRENCY at once
+    async with llm_scheduler.slot(user_id, priority):
+        try:
+            with clock.running():
+                stream = ollama_pool.generate(
+                    model=model,
+                    prompt=build_prompt(text_content, mcq + spare),
+                    format=quiz_schema(mcq + spare)
+                )
+                async for chunk in stream:
+                    for question in parser.feed(chunk["response"]):
+                        yield question
+                for question in parser.close():
+                    yield question
+            completed = True
+        finally:
+            if completed:
+                parse_yield.record(mcq, parser.valid, parser.rejected, spare)
+            else:
+                parse_yield.record_abandoned()
+
+async def generate_questions(text_content: str, mcq: int, user_id: str, priority: int = INTERACTIVE, model: str = QUIZ_MODEL):
+    """Map-reduce generation over long documents.
+
+    The text is split into SECTION_TOKENS sections (at most one per question, evenly sampled
+    across the document), each section is generated concurrently with bounded parallelism,
+    and the QuestionSelector reduce step picks the final `mcq` questions, yielding each one
+    as soon as it is accepted.
+    """
+    if mcq < 1:
+        return
+    sections = split_into_sections(text_content, SECTION_TOKENS)
+    sections = pick_sections(sections, min(MAP_MAX_SECTIONS, mcq))
+    if not sections:
+        return
+
+    clock = GenerationClock()
+    quotas = section_quotas(mcq, len(sections))
+    selector = QuestionSelector(mcq, quotas)
+    # Ask each section for one spare so duplicates and rejected questions can be backfilled
+    oversample = 1 if len(sections) > 1 else 0
+    results: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(MAP_CONCURRENCY)
+    errors = []
+    section_done = object()
+
+    async def map_section(index: int, section: str):
+        try:
+            async with semaphore:
+                async for question in stream_questions(section, quotas[index], user_id, priority, model, clock, spare=oversample):
+                    await results.put((index, question))
+        except Exception as e:
+            print(f"Generation failed for section {index + 1}/{len(sections)}: {e}")
+            errors.append(e)
+        finally:
+            await results.put((index, section_done))
+
+    tasks = [asyncio.create_task(map_section(i, section)) for i, section in enumerate(sections)]
+    try:
+        remaining = len(tasks)
+        while remaining and not selector.full:
+            index, question = await results.get()
+            if question is section_done:
+                remaining -= 1
+            elif selector.offer(index, question):
+                yield question
+        for question in selector.finish():
+            yield question
+        if not selector.accepted and errors:
+            raise errors[0]
+        model_selector.record(model, mcq, clock.seconds)
+    finally:
+        # Stop sections still generating once we have enough questions
+        for task in tasks:
+            task.cancel()
+
+def validate_latency_budget(latency_budget: float | None):
+    if latency_budget is not None and latency_budget <= 0:
+        raise HTTPException(status_code=400, detail="latency_budget must be a positive number of seconds")
+
+def choose_model(text_content: str, mcq: int, latency_budget: float | None = None) -> ModelChoice:
+    validate_latency_budget(latency_budget)
+    return model_selector.choose(estimate_tokens(text_content), mcq, llm_scheduler.queued, latency_budget)
+
+async def embed_texts(texts: list[str], user_id: str, priority: int = INTERACTIVE) -> list[list[float]]:
+    async with llm_scheduler.slot(user_id, priority):
+        response = await ollama_pool.embed(EMBED_MODEL, texts)
+    return response["embeddings"]
+
+async def plan_question_reuse(text_content: str, mcq: int, classroom_id: str, user_id: str, priority: int = INTERACTIVE, reuse: bool = True) -> ReusePlan:
+    """Embed the document's sections and pick banked questions for the ones seen before.
+
+    Banked questions carry their answers, so callers must first check that `user_id`
+    teaches `classroom_id` (require_classroom_teacher). With `reuse` off (regenerate), or
+    nothing banked for the classroom yet, no section can match, so nothing is embedded here
+    and `index_generated_questions` embeds the sections later. The bank is an optimisation:
+    if embedding fails the quiz is generated in full.
+    """
+    sections = split_into_sections(text_content, SECTION_TOKENS)
+    if not EMBED_MODEL or not sections or mcq < 1 or not reuse or not question_bank.has_chunks(classroom_id):
+        return ReusePlan(classroom_id, sections)
+    try:
+        vectors = await embed_texts(sections, user_id, priority)
+    except Exception as e:
+        print(f"Question bank lookup skipped, embedding failed: {e}")
+        return ReusePlan(classroom_id, sections)
+    return question_bank.plan(classroom_id, sections, vectors, mcq)
+
+def index_generated_questions(plan: ReusePlan, questions: list[dict], user_id: str):
+    """Bank newly generated questions in the background, so responses don't wait on embedding"""
+    async def index():
+        # Sections a cold or regenerating plan never embedded go in the same call as the questions
+        sections = plan.sections if plan.vectors is None else []
+        try:
+            vectors = await embed_texts(sections + [question["question_text"] for question in questions], user_id, BACKGROUND)
+            if sections:
+                plan.vectors = normalize(vectors[:len(sections)])
+            await question_bank.add(plan, questions, vectors[len(sections):])
+        except Exception as e:
+            print(f"Failed to add {len(questions)} question(s) to the question bank: {e}")
+
+    task = asyncio.create_task(index())
+    bank_indexing.add(task)
+    task.add_done_callback(bank_indexing.discard)
+
+async def generate_with_reuse(plan: ReusePlan, text_content: str, mcq: int, user_id: str, priority: int = INTERACTIVE, model: str = QUIZ_MODEL):
+    """Yield the plan's banked questions, then generate only the shortfall and bank it"""
+    for question in plan.reused:
+        yield question
+    shortfall = mcq - len(plan.reused)
+    if shortfall < 1:
+        return
+
+    generated = []
+    async for question in generate_questions(plan.remaining_text or text_content, shortfall, user_id, priority, model):
+        generated.append(question)
+        yield question
+
+    if generated and EMBED_MODEL and plan.sections:
+        index_generated_questions(plan, generated, user_id)
+
+async def save_quiz(user_id: str, name: str, classroom_id: str, questions: list[dict], model: str = QUIZ_MODEL) -> str:
+    """Insert the quiz row and its Q&A rows, returning the new quiz id"""
+    quiz_resp = await db.execute(supabase.table("quizzes").insert({
+        "user_id": user_id,
+        "name": name,
+        "classroom_id": classroom_id,
+        "is_completed": False,
+        "model": model # Which model wrote the questions, for comparing quality across tiers
+    }))
+    quiz_id = quiz_resp.data[0]["id"]
+
+    quiz_questions = [{**q, "quiz_id": quiz_id} for q in questions]
+    if quiz_questions:
+        inserted = await db.execute(supabase.table("Q&A").insert(quiz_questions))
+        # Compile the answer key now so the first submissions don't have to; keys are positional in id order, as fetch_answer_rows reads them
+        answer_keys.put(quiz_id, sorted(inserted.data, key=lambda row: row["id"]))
+    return quiz_id
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 # Pydantic Models
 class SignupBody(BaseModel):
     email: str
@@ -184,7 +604,62 @@ class ClassroomCreate(BaseModel):
 class JoinClassroomRequest(BaseModel):
     classroom_id: str
 
+# Lifecycle
+@app.on_event("startup")
+async def on_startup():
+    await ollama_pool.start()
+    await model_warmer.start()
+    await question_bank.start()
+    await job_queue.start()
+    await submission_buffer.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await job_queue.shutdown(timeout=JOB_DRAIN_TIMEOUT)
+    await submission_buffer.shutdown()
+    # Banking is an optimisation; don't hold shutdown behind queued embeddings
+    for task in bank_indexing:
+        task.cancel()
+    await asyncio.gather(*bank_indexing, return_exceptions=True)
+    await model_warmer.shutdown()
+    await ollama_pool.shutdown()
+    pdf_extractor.shutdown()
+    db.shutdown(wait=True)
+
 # Routes
+@app.get("/metrics")
+async def get_metrics():
+    return {
+        "db": db.stats(),
+        "auth": token_verifier.stats(),
+        "jobs": job_queue.stats(),
+        "quiz_cache": quiz_cache.stats(),
+        "profiles": profile_cache.stats(),
+        "memberships": membership_cache.stats(),
+        "cookies": signed_cookies.stats(),
+        "answer_keys": answer_keys.stats(),
+        "submissions": submission_buffer.stats(),
+        "analytics": quiz_analytics.stats(),
+        "generation": parse_yield.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "ollama": ollama_pool.stats(),
+        "warmup": model_warmer.stats(),
+        "model_tiers": model_selector.stats(),
+        "question_bank": question_bank.stats()
+    }
+
+@app.get("/ready")
+async def get_readiness():
+    """200 once every quiz model tier is resident on at least one healthy Ollama host, else 503"""
+    resident = model_warmer.resident()
+    body = {
+        "ready": all(resident.values()),
+        "models": {model: {"ready": bool(hosts), "resident_on": hosts} for model, hosts in resident.items()}
+    }
+    if not body["ready"]:
+        raise HTTPException(status_code=503, detail=body)
+    return body
+
 @app.get("/debug-cookie-flow")
 async def debug_cookie_flow(request: Request, response: Response):
     """Comprehensive debug endpoint to test the entire cookie flow"""
@@ -219,20 +694,22 @@ async def debug_cookie_flow(request: Request, response: Response):
 @app.post("/signup")
 async def signup(body: SignupBody, response: Response):
     try:
-        auth_response = supabase.auth.sign_up({
+        auth_response = await db.run(supabase.auth.sign_up, {
             "email": body.email,
             "password": body.password
         })
         user = auth_response.user
         user_id = user.id
 
-        supabase.table("clientProfile").insert({
+        await db.execute(supabase.table("clientProfile").insert({
             "first_name": body.first_name,
             "last_name": body.last_name,
             "image_url": body.image_url,
             "pronouns": body.pronouns,
             "id": user_id
-        }).execute()
+        }))
+        # Drop any "no profile" entry cached for this id before the row existed
+        profile_cache.invalidate(user_id)
         
         # Set signed cookie after signup
         if auth_response.session:
@@ -245,7 +722,7 @@ async def signup(body: SignupBody, response: Response):
 @app.post("/login")
 async def login(body: LoginBody, response: Response):
     try:
-        auth_response = supabase.auth.sign_in_with_password({
+        auth_response = await db.run(supabase.auth.sign_in_with_password, {
             "email": body.email,
             "password": body.password
         })
@@ -266,59 +743,57 @@ async def login(body: LoginBody, response: Response):
         raise HTTPException(status_code=401, detail=str(e))
 
 @app.post("/logout")
-async def logout(response: Response):
+async def logout(request: Request, response: Response):
+    access_token = get_signed_cookie(request, "access_token")
+    if access_token:
+        token_verifier.forget(access_token)
     clear_signed_cookie(response, "access_token")
     return {"status": "success"}
 
 @app.post("/classroom")
 async def create_classroom(
     classroom_data: ClassroomCreate,
-    request: Request
+    user: AuthUser = Depends(get_current_user)
 ):
-    access_token = get_signed_cookie(request, "access_token")
-    
-    if not access_token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
     try:
-        user = supabase.auth.get_user(access_token)
-        
-        if not user or not user.user:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        teacher_id = user.user.id
-        
-        # Create classroom
-        classroom = supabase.table("classroom").insert({
-            "teacher_id": teacher_id,
-            "name": classroom_data.name
-        }).execute()
+        teacher_id = user.id
         
-        classroom_id = classroom.data[0]["id"]
-        
-        # Add teacher as classroom member with 'teacher' role
-        supabase.table("classroom_members").insert({
-            "classroom_id": classroom_id,
-            "user_id": teacher_id,
-            "role": "teacher"
-        }).execute()
-        
-        # Get classroom with teacher profile from clientProfile
-        result = supabase.table("classroom")\
-        .select("id, name, created_at, teacher_id")\
-        .eq("id", classroom_id)\
-        .single()\
-        .execute()
-        
-        # Get teacher profile from clientProfile
-        teacher_profile = supabase.table("clientProfile")\
-        .select("first_name, last_name, image_url, pronouns")\
-        .eq("id", teacher_id)\
-        .single()\
-        .execute()
-        
-        classroom_data = result.data
-        profile_data = teacher_profile.data if teacher_profile.data else {}
+        # Only the profile read overlaps the writes; the two inserts run in order, without the
+        # read timeout (timeout=0), so a slow insert can't be abandoned after it committed
+        profile_read = asyncio.ensure_future(profile_cache.get(teacher_id))
+        try:
+            classroom = await db.execute(supabase.table("classroom").insert({
+                "teacher_id": teacher_id,
+                "name": classroom_data.name
+            }), timeout=0)
+            classroom_id = classroom.data[0]["id"]
+
+            # Add teacher as classroom member with 'teacher' role
+            try:
+                await db.execute(supabase.table("classroom_members").insert({
+                    "classroom_id": classroom_id,
+                    "user_id": teacher_id,
+                    "role": "teacher"
+                }), timeout=0)
+            except Exception:
+                # Don't leave behind a classroom its teacher could never manage
+                await db.execute(supabase.table("classroom").delete().eq("id", classroom_id), timeout=0)
+                raise
+        except BaseException:
+            profile_read.cancel()
+            raise
+        membership_cache.remember(teacher_id, classroom_id, "teacher")
+
+        try:
+            teacher_profile = await profile_read
+        except Exception as e:
+            # The classroom exists either way; the profile only decorates the response
+            print(f"Teacher profile read failed after creating classroom {classroom_id}: {e}")
+            teacher_profile = None
+
+        # The insert already returns the new row, so there is no need to read it back
+        classroom_data = classroom.data[0]
+        profile_data = teacher_profile or {}
         
         return {
             "status": "success",
@@ -342,59 +817,44 @@ async def create_classroom(
 @app.post("/classroom/join")
 async def join_classroom(
     join_request: JoinClassroomRequest,
-    request: Request
+    user: AuthUser = Depends(get_current_user)
 ):
-    access_token = get_signed_cookie(request, "access_token")
-    
-    if not access_token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
     try:
-        user = supabase.auth.get_user(access_token)
-        
-        if not user or not user.user:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user_id = user.user.id
+        user_id = user.id
         classroom_id = join_request.classroom_id
         
-        # Verify classroom exists and get teacher info
-        classroom_result = supabase.table("classroom")\
-        .select("id, name, teacher_id")\
-        .eq("id", classroom_id)\
-        .single()\
-        .execute()
+        # Verify classroom exists and check existing membership concurrently
+        classroom_result, existing_member = await db.gather(
+            supabase.table("classroom")
+            .select("id, name, teacher_id")
+            .eq("id", classroom_id)
+            .single(),
+            supabase.table("classroom_members")
+            .select("id")
+            .eq("classroom_id", classroom_id)
+            .eq("user_id", user_id)
+        )
         
         if not classroom_result.data:
             raise HTTPException(status_code=404, detail="Classroom not found")
         
-        classroom = classroom_result.data
-        
-        # Get teacher profile from clientProfile
-        teacher_profile = supabase.table("clientProfile")\
-        .select("first_name, last_name, image_url, pronouns")\
-        .eq("id", classroom["teacher_id"])\
-        .single()\
-        .execute()
-        
-        # Check if user is already a member
-        existing_member = supabase.table("classroom_members")\
-        .select("id")\
-        .eq("classroom_id", classroom_id)\
-        .eq("user_id", user_id)\
-        .execute()
-        
         if existing_member.data:
             raise HTTPException(status_code=400, detail="You are already a member of this classroom")
         
-        # Add user as student member
-        supabase.table("classroom_members").insert({
-            "classroom_id": classroom_id,
-            "user_id": user_id,
-            "role": "student"
-        }).execute()
+        classroom = classroom_result.data
+        
+        # Get teacher profile and add user as student member concurrently
+        teacher_profile, _ = await asyncio.gather(
+            profile_cache.get(classroom["teacher_id"]),
+            db.execute(supabase.table("classroom_members").insert({
+                "classroom_id": classroom_id,
+                "user_id": user_id,
+                "role": "student"
+            }))
+        )
+        membership_cache.remember(user_id, classroom_id, "student")
         
-        teacher_data = teacher_profile.data if teacher_profile.data else {}
+        teacher_data = teacher_profile or {}
         
         return {
             "status": "success",
@@ -418,23 +878,14 @@ async def join_classroom(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/classrooms")
-async def get_my_classrooms(request: Request):
-    access_token = get_signed_cookie(request, "access_token")
-    
-    if not access_token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
+async def get_my_classrooms(user: AuthUser = Depends(get_current_user)):
     try:
-        user = supabase.auth.get_user(access_token)
-        
-        if not user or not user.user:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user_id = user.user.id
+        user_id = user.id
         
         # Get classrooms where user is a member with teacher profiles
-        memberships = supabase.table("classroom_members")\
-        .select("""
+        memberships = await db.execute(
+            supabase.table("classroom_members")
+            .select("""
         role, 
         joined_at,
         classroom:classroom_id (
@@ -443,22 +894,21 @@ async def get_my_classrooms(request: Request):
             created_at, 
             teacher_id
         )
-        """)\
-        .eq("user_id", user_id)\
-        .execute()
+        """)
+            .eq("user_id", user_id)
+        )
         
+        # Get every teacher profile in one batched lookup instead of one query per classroom;
+        # only the ids missing from the profile cache reach the database
+        teacher_ids = [m["classroom"]["teacher_id"] for m in memberships.data if m.get("classroom")]
+        teacher_profiles = await profile_cache.get_many(teacher_ids)
+
         classrooms = []
         for membership in memberships.data:
             classroom_data = membership["classroom"]
-            
-            # Get teacher profile for each classroom
-            teacher_profile = supabase.table("clientProfile")\
-            .select("first_name, last_name, image_url, pronouns")\
-            .eq("id", classroom_data["teacher_id"])\
-            .single()\
-            .execute()
-            
-            teacher_data = teacher_profile.data if teacher_profile.data else {}
+            if not classroom_data:
+                continue
+            teacher_data = teacher_profiles.get(classroom_data["teacher_id"], {})
             
             classrooms.append({
                 "id": classroom_data["id"],
@@ -484,62 +934,70 @@ async def get_my_classrooms(request: Request):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/classroom/{classroom_id}")
-async def get_classroom_details(classroom_id: str, request: Request):
-    access_token = get_signed_cookie(request, "access_token")
-    if not access_token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+CLASSROOM_SECTIONS = ("members", "quizzes")
 
+@app.get("/classroom/{classroom_id}")
+async def get_classroom_details(
+    classroom_id: str,
+    request: Request,
+    response: Response,
+    include: str = Query(",".join(CLASSROOM_SECTIONS), description="Comma-separated sections to return: members, quizzes"),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size for each section; omit for everything"),
+    members_cursor: str | None = Query(None, description="next_cursors.members from the previous page"),
+    quizzes_cursor: str | None = Query(None, description="next_cursors.quizzes from the previous page"),
+    member: ClassroomMember = Depends(get_classroom_member)
+):
     try:
-        user = supabase.auth.get_user(access_token)
-        if not user or not user.user:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user_id = user.user.id
-
-        # Check membership
-        membership = supabase.table("classroom_members")\
-        .select("role")\
-        .eq("classroom_id", classroom_id)\
-        .eq("user_id", user_id)\
-        .execute()
-
-        if not membership.data:
-            raise HTTPException(status_code=403, detail="Not a member of this classroom")
-
-        your_role = membership.data[0]["role"]
-
-        # Get classroom info
-        classroom = supabase.table("classroom")\
-        .select("id, name, created_at, teacher_id")\
-        .eq("id", classroom_id)\
-        .single()\
-        .execute()
-
-        # Get teacher profile
-        teacher_profile = supabase.table("clientProfile")\
-        .select("first_name, last_name, image_url, pronouns")\
-        .eq("id", classroom.data["teacher_id"])\
-        .single()\
-        .execute()
-
-        # GET ALL QUIZZES IN THIS CLASSROOM
-        quizzes_result = supabase.table("quizzes")\
-        .select("name, is_completed, classroom_id, id, created_at")\
-        .eq("classroom_id", classroom_id) \
-        .execute()
-  
-        # print(quizzes_result.data[0])
-        # print(classroom_id)
-        # Get members
-        members_result = supabase.table("classroom_members")\
-        .select("role, joined_at, user_id, clientProfile:user_id(first_name, last_name, image_url, pronouns)")\
-        .eq("classroom_id", classroom_id)\
-        .execute()
+        sections = parse_include(include, CLASSROOM_SECTIONS)
+
+        # Polling clients send back the ETag; if the classroom's revision (kept by triggers,
+        # migrations/004) hasn't moved, one cheap read replaces every query. It is read
+        # before the data so an ETag never claims data newer than it describes.
+        if ETAGS:
+            stamp = await db.execute(supabase.table("classroom").select("revision").eq("id", classroom_id).single())
+            etag = make_etag(
+                "classroom", classroom_id, stamp.data["revision"],
+                member.user.id, member.role, request.url.query
+            )
+            if not_modified(request, etag):
+                return Response(status_code=304, headers={"ETag": etag})
+            response.headers["ETag"] = etag
+
+        # Only the requested sections are queried; those that are run together.
+        # Members page on (joined_at, user_id) and quizzes on (created_at, id).
+        queries = {
+            "classroom": supabase.table("classroom")
+            .select("id, name, created_at, teacher_id")
+            .eq("id", classroom_id)
+            .single()
+        }
+        if "quizzes" in sections:
+            queries["quizzes"] = keyset(
+                supabase.table("quizzes")
+                .select("name, is_completed, classroom_id, id, created_at")
+                .eq("classroom_id", classroom_id),
+                "created_at", "id", quizzes_cursor, limit
+            )
+        if "members" in sections:
+            queries["members"] = keyset(
+                supabase.table("classroom_members")
+                .select("role, joined_at, user_id, clientProfile:user_id(first_name, last_name, image_url, pronouns)")
+                .eq("classroom_id", classroom_id),
+                "joined_at", "user_id", members_cursor, limit
+            )
+        results = dict(zip(queries, await db.gather(*queries.values())))
+        classroom = results["classroom"]
+        next_cursors = {}
+
+        your_role = member.role
 
         members = []
-        for m in members_result.data:
-            profile = m.get("clientProfile", {}) or {}
+        member_rows = []
+        if "members" in sections:
+            member_rows, next_cursors["members"] = page(results["members"].data, "joined_at", "user_id", limit)
+        for m in member_rows:
+            # The members query embeds each profile anyway, so keep the cache warm with them
+            profile = profile_cache.prime(m["user_id"], m.get("clientProfile")) or {}
             members.append({
                 "user_id": m["user_id"],
                 "role": m["role"],
@@ -550,9 +1008,13 @@ async def get_classroom_details(classroom_id: str, request: Request):
                 "pronouns": profile.get("pronouns")
             })
 
-        teacher_data = teacher_profile.data or {}
+        # The teacher is a member too, so their profile usually came back with the members
+        teacher_id = classroom.data["teacher_id"]
+        teacher_data = next((m for m in members if m["user_id"] == teacher_id), None)
+        if teacher_data is None:
+            teacher_data = await profile_cache.get(teacher_id) or {}
 
-        return {
+        body = {
             "status": "success",
             "classroom": {
                 "id": classroom.data["id"],
@@ -566,43 +1028,38 @@ async def get_classroom_details(classroom_id: str, request: Request):
                     "pronouns": teacher_data.get("pronouns")
                 }
             },
-            "quizzes": quizzes_result.data, # This shows all quizzes
-            "members": members,
             "your_role": your_role
         }
+        if "quizzes" in sections:
+            body["quizzes"], next_cursors["quizzes"] = page(results["quizzes"].data, "created_at", "id", limit)
+        if "members" in sections:
+            body["members"] = members
+        body["next_cursors"] = next_cursors
+        return body
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/classroom/{classroom_id}/students")
-async def get_classroom_students(classroom_id: str, request: Request):
-    access_token = get_signed_cookie(request, "access_token")
-    
-    if not access_token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
+async def get_classroom_students(
+    classroom_id: str,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size; omit for every student"),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    member: ClassroomMember = Depends(get_classroom_member)
+):
     try:
-        user = supabase.auth.get_user(access_token)
-        
-        if not user or not user.user:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user_id = user.user.id
-        
         # Verify user is a teacher in this classroom
-        membership = supabase.table("classroom_members")\
-        .select("role")\
-        .eq("classroom_id", classroom_id)\
-        .eq("user_id", user_id)\
-        .single()\
-        .execute()
-        
-        if not membership.data or membership.data["role"] != "teacher":
+        if not member.is_teacher:
             raise HTTPException(status_code=403, detail="Only teachers can view student list")
         
-        # Get all students in this classroom with their profiles
-        students_result = supabase.table("classroom_members")\
-        .select("""
+        # Get a page of students in this classroom with their profiles, ordered by (joined_at, user_id).
+        # The first page of a paginated listing also counts the whole class in the same request.
+        students_result = await db.execute(
+            keyset(
+                supabase.table("classroom_members")
+                .select("""
         joined_at,
         user_id,
         clientProfile:user_id (
@@ -611,14 +1068,17 @@ async def get_classroom_students(classroom_id: str, request: Request):
             image_url, 
             pronouns
         )
-        """)\
-        .eq("classroom_id", classroom_id)\
-        .eq("role", "student")\
-        .execute()
+        """, count="exact" if limit is not None and not cursor else None)
+                .eq("classroom_id", classroom_id)
+                .eq("role", "student"),
+                "joined_at", "user_id", cursor, limit
+            )
+        )
+        student_rows, next_cursor = page(students_result.data, "joined_at", "user_id", limit)
         
         students = []
-        for student in students_result.data:
-            profile_data = student.get("clientProfile", {})
+        for student in student_rows:
+            profile_data = profile_cache.prime(student["user_id"], student.get("clientProfile")) or {}
             students.append({
                 "user_id": student["user_id"],
                 "joined_at": student["joined_at"],
@@ -631,7 +1091,9 @@ async def get_classroom_students(classroom_id: str, request: Request):
         return {
             "status": "success",
             "students": students,
-            "total_students": len(students)
+            # Later pages are filtered by the cursor, so only the first page knows the total
+            "total_students": len(students) if limit is None else students_result.count,
+            "next_cursor": next_cursor
         }
         
     except HTTPException:
@@ -647,31 +1109,29 @@ async def get_user(request: Request):
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     try:
-        # First, verify the user with Supabase auth
-        user = supabase.auth.get_user(access_token)
-        
-        if not user or not user.user:
+        # created_at only lives on the Supabase user record, so this route asks
+        # Supabase once per token; the verifier caches the answer until the token expires
+        user = await token_verifier.verify(access_token, remote=True)
+
+        if not user:
             raise HTTPException(status_code=401, detail="Invalid token")
-        
+
         # Get the user's UUID
-        user_id = user.user.id
+        user_id = user.id
         
-        # Now query the clientProfile table using the UUID relation
-        profile_response = supabase.table("clientProfile")\
-        .select("*")\
-        .eq("id", user_id)\
-        .execute()
+        # Now look up the clientProfile row for the UUID (usually served from the profile cache)
+        profile_data = await profile_cache.get(user_id)
         
-        print(f"Profile query for user_id {user_id}: {profile_response}")
+        print(f"Profile lookup for user_id {user_id}: {profile_data}")
         
-        if not profile_response.data or len(profile_response.data) == 0:
+        if not profile_data:
             # No profile found, return basic user info
             return {
                 "status": "success",
                 "user": {
-                    "id": user.user.id,
-                    "email": user.user.email,
-                    "created_at": user.user.created_at,
+                    "id": user.id,
+                    "email": user.email,
+                    "created_at": user.created_at,
                     "first_name": None,
                     "last_name": None,
                     "image_url": None,
@@ -680,18 +1140,17 @@ async def get_user(request: Request):
             }
         
         # Profile found, return combined data
-        profile_data = profile_response.data[0]
         
         return {
             "status": "success",
             "user": {
-                "id": user.user.id,
-                "email": user.user.email,
+                "id": user.id,
+                "email": user.email,
                 "first_name": profile_data.get("first_name"),
                 "last_name": profile_data.get("last_name"),
                 "image_url": profile_data.get("image_url"),
                 "pronouns": profile_data.get("pronouns"),
-                "created_at": user.user.created_at,
+                "created_at": user.created_at,
             }
         }
         
@@ -700,38 +1159,46 @@ async def get_user(request: Request):
         raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
 
 @app.get("/classroom/{classroom_id}/quiz/{quiz_id}")
-async def fetch_quiz(quiz_id: str, classroom_id: str, request: Request):
-
-    access_token = get_signed_cookie(request, "access_token")
-    if not access_token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+async def fetch_quiz(
+    quiz_id: str,
+    classroom_id: str,
+    request: Request,
+    response: Response,
+    member: ClassroomMember = Depends(get_classroom_member)
+):
     try:
-        user = supabase.auth.get_user(access_token)
-        user_id = user.user.id
-        membership = supabase.table("classroom_members").select("role").eq("classroom_id", classroom_id).eq("user_id", user_id).single().execute()
+        user_id = member.user.id
 
-        quizzes_info = supabase.table("quizzes").select("id, name, is_completed, classroom_id").eq("id", quiz_id).eq("classroom_id", classroom_id).single().execute()
-        if not membership.data:
-            raise HTTPException(status_code=403, detail="Not a member of this classroom")
+        # The quiz's revision (migrations/004) covers the quiz row, its questions and submissions
+        if ETAGS:
+            stamp = await db.execute(
+                supabase.table("quizzes").select("revision").eq("id", quiz_id).eq("classroom_id", classroom_id).single()
+            )
+            etag = make_etag("quiz", classroom_id, quiz_id, stamp.data["revision"], user_id, member.role)
+            if not_modified(request, etag):
+                return Response(status_code=304, headers={"ETag": etag})
+            response.headers["ETag"] = etag
+
+        # One round trip for the quiz, its questions and the caller's submission. Answers
+        # are fetched up front and stripped below for students until the quiz is completed.
+        quizzes_info, quiz_info, quiz_submission = await db.gather(
+            supabase.table("quizzes").select("id, name, is_completed, classroom_id").eq("id", quiz_id).eq("classroom_id", classroom_id).single(),
+            supabase.table("Q&A").select("question_text, options, correct_answer").eq("quiz_id", quiz_id).order("id"),
+            supabase.table("quiz-submissions").select("answer").eq("quiz_id", quiz_id).eq("student_id", user_id)
+        )
         completed_status = quizzes_info.data["is_completed"]
-        user_role = membership.data["role"]
+        user_role = member.role
         
         print(f"User role: {user_role}, Quiz completed: {completed_status}, {quiz_id}")
 
         if user_role == "teacher" or completed_status:
-            quiz_info = supabase.table("Q&A").select("question_text, options, correct_answer").eq("quiz_id", quiz_id).execute()
-            quiz_submission = supabase.table("quiz-submissions").select("answer").eq("quiz_id", quiz_id).eq("student_id", user_id).execute()
             return quiz_info.data, quiz_submission.data
-            
-        
-                
-                
         else:
-            student_quiz_info = supabase.table("Q&A").select("question_text, options").eq("quiz_id", quiz_id).execute()
-            quiz_submission = supabase.table("quiz-submissions").select("answer").eq("quiz_id", quiz_id).eq("student_id", user_id).execute()
-
-            return student_quiz_info.data, quiz_submission.data
-            
+            student_quiz_info = [
+                {"question_text": q["question_text"], "options": q["options"]}
+                for q in quiz_info.data
+            ]
+            return student_quiz_info, quiz_submission.data
 
     except HTTPException:
         raise
@@ -739,85 +1206,59 @@ async def fetch_quiz(quiz_id: str, classroom_id: str, request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+completed_quizzes = TTLCache(maxsize=10000, ttl=3600.0) # Quiz ids already marked is_completed
+
+async def flush_submissions(rows: list[dict]):
+    """Write a batch from the submission buffer: one bulk insert, one is_completed update.
+
+    Upserting on submission_key (migrations/001) makes a batch replayed after a crash a no-op.
+    """
+    await db.execute(supabase.table("quiz-submissions").upsert(rows, on_conflict="submission_key", ignore_duplicates=True))
+
+    quiz_ids = list(dict.fromkeys(row["quiz_id"] for row in rows))
+    # Coalesced: each quiz is updated once per batch, and not again once it is marked
+    to_complete = [quiz_id for quiz_id in quiz_ids if quiz_id not in completed_quizzes]
+    if to_complete:
+        update_result = await db.execute(
+            supabase.table("quizzes")
+            .update({"is_completed": True})
+            .in_("id", to_complete)
+        )
+        for quiz_row in update_result.data or []:
+            completed_quizzes.set(quiz_row["id"], True)
+
+submission_buffer = SubmissionBuffer(
+    os.path.join(DATA_DIR, "submissions.log"),
+    flush_submissions,
+    batch_size=SUBMISSION_BATCH_SIZE,
+    flush_interval=SUBMISSION_FLUSH_INTERVAL
+)
+
 @app.post("/results/{quiz_id}/answers/{answer}")
-async def submit_quiz_results(quiz_id: str, request: Request, answer: str):
-    access_token = get_signed_cookie(request, "access_token")
-    if not access_token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
+async def submit_quiz_results(quiz_id: str, answer: str, user: AuthUser = Depends(get_current_user)):
     try:
-        user = supabase.auth.get_user(access_token)
-        user_id = user.user.id
+        user_id = user.id
         
         # Convert user answers string to list
         answers_list = answer.split(",")
         print(f"🔍 DEBUG: User answers received: {answers_list}")
         print(f"🔍 DEBUG: Number of user answers: {len(answers_list)}")
         
-        # Get ALL questions for this quiz with detailed info
-        quiz_questions = supabase.table("Q&A")\
-            .select("id, question_text, options, correct_answer")\
-            .eq("quiz_id", quiz_id)\
-            .execute()
+        # The compiled answer key is cached per quiz, so grading normally costs no query
+        answer_key = await answer_keys.get(quiz_id)
         
-        if not quiz_questions.data:
+        if answer_key is None:
             raise HTTPException(status_code=404, detail="No questions found for this quiz")
         
-        print(f"🔍 DEBUG: Found {len(quiz_questions.data)} questions in database")
-        
-        # Extract correct answers and debug each one
-        correct_answers_list = []
-        for i, question in enumerate(quiz_questions.data):
-            correct_answer_data = question["correct_answer"]
-            print(f"🔍 DEBUG: Question {i+1} - ID: {question['id']}")
-            print(f"🔍 DEBUG: Question text: {question['question_text'][:50]}...")
-            print(f"🔍 DEBUG: Options: {question['options']}")
-            print(f"🔍 DEBUG: Raw correct_answer: {correct_answer_data}")
-            print(f"🔍 DEBUG: Type of correct_answer: {type(correct_answer_data)}")
-            
-            # Handle different storage formats
-            if correct_answer_data is None:
-                correct_letter = ""
-                print(f"❌ ERROR: No correct answer for question {i+1}")
-            elif isinstance(correct_answer_data, list):
-                if len(correct_answer_data) > 0:
-                    correct_letter = str(correct_answer_data[0]).strip().upper()
-                    print(f"✅ List format - Extracted: '{correct_letter}'")
-                else:
-                    correct_letter = ""
-                    print(f"❌ ERROR: Empty list for question {i+1}")
-            else:
-                correct_letter = str(correct_answer_data).strip().upper()
-                print(f"✅ String format - Extracted: '{correct_letter}'")
-            
-            correct_answers_list.append(correct_letter)
-        
-        print(f"🔍 DEBUG: Final correct answers list: {correct_answers_list}")
-        print(f"🔍 DEBUG: Final user answers list: {answers_list}")
-        
-        # Calculate score
-        score = 0
-        total_questions = len(correct_answers_list)
+        correct_answers_list = list(answer_key.letters)
+        total_questions = len(answer_key)
+        print(f"🔍 DEBUG: Correct answers list: {correct_answers_list}")
         
         # Check if we have matching number of questions
         if len(answers_list) != total_questions:
             print(f"⚠️ WARNING: User provided {len(answers_list)} answers but there are {total_questions} questions")
         
-        # Check each answer with detailed comparison
-        print("🔍 DEBUG: Starting answer comparison:")
-        for i in range(min(len(answers_list), total_questions)):
-            user_answer = answers_list[i].strip().upper()
-            correct_answer = correct_answers_list[i]
-            
-            print(f"🔍 DEBUG: Q{i+1} - User: '{user_answer}' vs Correct: '{correct_answer}'")
-            print(f"🔍 DEBUG: Q{i+1} - Are they equal? {user_answer == correct_answer}")
-            
-            if user_answer == correct_answer:
-                score += 1
-                print(f"✅ Question {i+1}: CORRECT - Score now: {score}")
-            else:
-                print(f"❌ Question {i+1}: WRONG - User: {user_answer}, Correct: {correct_answer}")
-        
+        score = answer_key.grade(answers_list)
         print(f"🔍 DEBUG: Final score: {score}/{total_questions}")
         
         # Calculate percentage
@@ -828,21 +1269,17 @@ async def submit_quiz_results(quiz_id: str, request: Request, answer: str):
             "student_id": user_id,
             "quiz_id": quiz_id,
             "answer": answers_list,
-            "score": score
+            "score": score,
+            # Set here rather than defaulted on insert: rows flushed in one batch would share a timestamp
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "submission_key": str(uuid4()) # Idempotency key; stays the same if the log replays this row
         }
         
-        print(f"🔍 DEBUG: Saving to quiz-submissions: {result_data}")
-        
-        # Insert into quiz-submissions table
-        submission_result = supabase.table("quiz-submissions").insert(result_data).execute()
-        print(f"🔍 DEBUG: Submission result: {submission_result.data}")
+        print(f"🔍 DEBUG: Queueing for quiz-submissions: {result_data}")
         
-        # Mark quiz as completed for this user
-        update_result = supabase.table("quizzes")\
-            .update({"is_completed": True})\
-            .eq("id", quiz_id)\
-            .execute()
-        print(f"🔍 DEBUG: Quiz update result: {update_result.data}")
+        # Logged durably here; the insert and the is_completed update happen in batches
+        await submission_buffer.submit(result_data)
+        quiz_analytics.record(answer_key, answers_list, result_data["submission_key"])
         
         return {
             "status": "success",
@@ -851,164 +1288,283 @@ async def submit_quiz_results(quiz_id: str, request: Request, answer: str):
         }
         
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ ERROR in submit_quiz_results: {str(e)}")
         import traceback
         print(f"❌ Stack trace: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=str(e))
 
-    
-@app.post("/generate-quiz")
-async def generate_quiz(
-    request: Request,
-    file: UploadFile = File(...),
-    name: str = Form(...),
-    num_questions: int = Form(...),
-    mcq: int = Form(...),
-    frq: int = Form(0),
-    classroom_id: str = Form(...)
-):
-    access_token = get_signed_cookie(request, "access_token")
 
-    if not access_token:
-        print("No access token found in cookies")
-        raise HTTPException(status_code=401, detail="Not authenticated")
+# Gradebook
+REGRADE_CHUNK_SIZE = 500 # Submission ids per UPDATE ... WHERE id IN (...), keeps the URL short
+
+def submitted_answers(answer) -> list[str]:
+    # submit_quiz_results stores a list; tolerate a comma-separated string too
+    if isinstance(answer, str):
+        return answer.split(",")
+    return list(answer or [])
+
+async def grade_classroom(classroom_id: str, quiz_id: str | None = None) -> tuple[list[dict], dict, float]:
+    """Load a classroom's quizzes, all their submissions and answer keys in bulk, then grade.
+
+    Returns (quizzes, {quiz_id: (submission rows, correct matrix, scores)}, grading ms).
+    Submission rows are ordered by (created_at, id), so the last row per student is their
+    latest attempt; ids are uuids and say nothing about order.
+    Quizzes without an answer key are left out of the graded dict rather than scored as 0.
+    """
+    query = supabase.table("quizzes").select("id, name, created_at").eq("classroom_id", classroom_id)
+    if quiz_id:
+        query = query.eq("id", quiz_id)
+    quizzes = (await db.execute(query.order("created_at"))).data
+    quiz_ids = [quiz["id"] for quiz in quizzes]
+    if not quiz_ids:
+        return quizzes, {}, 0.0
+
+    submissions, keys = await asyncio.gather(
+        db.fetch_all(
+            lambda: supabase.table("quiz-submissions")
+            .select("id, student_id, quiz_id, answer, score, created_at")
+            .in_("quiz_id", quiz_ids)
+            .order("created_at")
+            .order("id"),
+            page_size=DB_PAGE_SIZE
+        ),
+        answer_keys.get_many(quiz_ids)
+    )
+    started = time.perf_counter()
+    rows_by_quiz: dict[str, list[dict]] = {}
+    for row in submissions:
+        rows_by_quiz.setdefault(row["quiz_id"], []).append(row)
+
+    graded = {}
+    for quiz in quizzes:
+        key = keys.get(quiz["id"])
+        if key is None:
+            continue
+        rows = rows_by_quiz.get(quiz["id"], [])
+        correct = grade(key, [submitted_answers(row["answer"]) for row in rows])
+        graded[quiz["id"]] = (rows, correct, correct.sum(axis=1))
+    return quizzes, graded, (time.perf_counter() - started) * 1000
+
+@app.get("/classroom/{classroom_id}/gradebook")
+async def get_gradebook(classroom_id: str, member: ClassroomMember = Depends(get_classroom_member)):
+    """Per-student totals and per-quiz stats, graded from the current answer keys"""
     try:
-        # Validate the form data
-        if num_questions < 1:
-            raise HTTPException(status_code=400, detail="Number of questions must be at least 1")
-        
-        if mcq < 0 or mcq > num_questions:
-            raise HTTPException(status_code=400, detail="MCQ count must be between 0 and total questions")
-        print("MCQ count validated")
-        # Validate file type
-        allowed_extensions = ['.txt', '.pdf', '.docx', '.json']
-        file_extension = os.path.splitext(file.filename.lower())[1]
-        print("File extension good")
-        if file_extension not in allowed_extensions:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"File type {file_extension} not allowed. Please use: {', '.join(allowed_extensions)}"
-            )
+        if not member.is_teacher:
+            raise HTTPException(status_code=403, detail="Only teachers can view the gradebook")
 
-        # Read file content
-        content = await file.read()
-        text_content = ""
-
-        print(f"Processing file: {file.filename}, Size: {len(content)} bytes, Type: {file_extension}")
-
-        # Handle different file types
-        if file_extension == '.pdf':
-            text_content = extract_text_from_pdf(content)
-        elif file_extension == '.docx':
-            text_content = extract_text_from_docx(content)
-        elif file_extension == '.json':
-            text_content = extract_text_from_json(content)
-        elif file_extension == '.txt':
-            print("Extracting text from TXT file")
-            text_content = extract_text_from_txt(content)
-        else:
-            # Final fallback - try as text
-            text_content = extract_text_from_txt(content)
-
-        if not text_content.strip():
-            raise HTTPException(status_code=400, detail="No readable text content found in the file")
-
-        print(f"Extracted text length: {len(text_content)} characters")
-        print(f"First 200 chars: {text_content[:200]}...")
+        quizzes, graded, grading_ms = await grade_classroom(classroom_id)
+        started = time.perf_counter()
 
-        # Limit text content to avoid overwhelming the AI
-        if len(text_content) > 8000:
-            text_content = text_content[:8000] + "... [content truncated]"
+        quiz_stats = []
+        students: dict[str, dict] = {}
+        stale_scores = 0
+        for quiz in quizzes:
+            if quiz["id"] not in graded:
+                continue
+            rows, correct, scores = graded[quiz["id"]]
+            stale = changed_scores([row["id"] for row in rows], [row["score"] for row in rows], scores)
+            stale_scores += sum(len(ids) for ids in stale.values())
+
+            # Only each student's latest attempt counts; rows are in (created_at, id) order
+            latest = {row["student_id"]: index for index, row in enumerate(rows)}
+            latest_indexes = sorted(latest.values())
+            quiz_stats.append({
+                "quiz_id": quiz["id"],
+                "name": quiz["name"],
+                **score_stats(scores[latest_indexes], correct[latest_indexes])
+            })
+            for student_id, index in latest.items():
+                student = students.setdefault(student_id, {"student_id": student_id, "total_score": 0, "total_possible": 0, "scores": {}})
+                student["scores"][quiz["id"]] = int(scores[index])
+                student["total_score"] += int(scores[index])
+                student["total_possible"] += correct.shape[1]
+
+        grading_ms = round(grading_ms + (time.perf_counter() - started) * 1000, 2)
+        profiles = await profile_cache.get_many(students)
+        for student_id, student in students.items():
+            profile = profiles.get(student_id, {})
+            student["first_name"] = profile.get("first_name")
+            student["last_name"] = profile.get("last_name")
+            student["quizzes_taken"] = len(student["scores"])
+            student["percentage"] = round(student["total_score"] / student["total_possible"] * 100, 2) if student["total_possible"] else 0.0
 
-        # Ollama prompt
-        prompt = f"""
-Based on this content, generate exactly {mcq} multiple-choice questions:
+        return {
+            "status": "success",
+            "quizzes": quiz_stats,
+            "students": sorted(students.values(), key=lambda s: (s["last_name"] or "", s["first_name"] or "", s["student_id"])),
+            "stale_scores": stale_scores,
+            "ungraded_quizzes": [quiz["id"] for quiz in quizzes if quiz["id"] not in graded],
+            "grading_ms": grading_ms
+        }
 
-{text_content}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-Each question must have:
-- Clear question text
-- 4 options (A, B, C, D)
-- One correct answer
+@app.post("/classroom/{classroom_id}/gradebook/regrade")
+async def regrade_classroom(
+    classroom_id: str,
+    quiz_id: str | None = Query(None, description="Re-grade a single quiz instead of the whole classroom"),
+    member: ClassroomMember = Depends(get_classroom_member)
+):
+    """Re-grade stored submissions against the current answer keys (e.g. after /updated-generate-quiz)
+    and write back only the scores that changed"""
+    try:
+        if not member.is_teacher:
+            raise HTTPException(status_code=403, detail="Only teachers can re-grade quizzes")
+
+        quizzes, graded, _ = await grade_classroom(classroom_id, quiz_id)
+
+        updates = []
+        changed_quizzes = []
+        checked = 0
+        for quiz in quizzes:
+            if quiz["id"] not in graded:
+                continue # No answer key to grade against; leave its scores alone
+            rows, _, scores = graded[quiz["id"]]
+            checked += len(rows)
+            groups = changed_scores([row["id"] for row in rows], [row["score"] for row in rows], scores)
+            if groups:
+                changed_quizzes.append(quiz["id"])
+            for score, ids in groups.items():
+                for start in range(0, len(ids), REGRADE_CHUNK_SIZE):
+                    updates.append(
+                        supabase.table("quiz-submissions")
+                        .update({"score": score})
+                        .in_("id", ids[start:start + REGRADE_CHUNK_SIZE])
+                    )
+
+        # One UPDATE per distinct new score (per chunk), all in flight together
+        results = await db.gather(*updates)
 
-Format each question like this:
-Q: [question text]
-A: [option A]
-B: [option B]
-C: [option C]
-D: [option D]
-Correct: [A/B/C/D] LETTER NOT TEXT
+        return {
+            "status": "success",
+            "checked": checked,
+            "updated": sum(len(result.data or []) for result in results),
+            "quizzes_changed": changed_quizzes,
+            "quizzes_skipped": [quiz["id"] for quiz in quizzes if quiz["id"] not in graded]
+        }
 
-Make questions relevant to the content.
-"""
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        ollama_response = ollama.generate(model="gpt-oss:120b", prompt=prompt)
-        raw_text = ollama_response["response"]
+# Per-question analytics
+async def load_quiz_analytics(classroom_id: str, quiz_id: str, rebuild: bool = False):
+    """The quiz's running analytics, rebuilt from stored submissions when missing, stale or asked to"""
+    quiz, answer_key = await asyncio.gather(
+        db.execute(
+            supabase.table("quizzes")
+            .select("id")
+            .eq("id", quiz_id)
+            .eq("classroom_id", classroom_id)
+        ),
+        answer_keys.get(quiz_id)
+    )
+    if not quiz.data:
+        raise HTTPException(status_code=404, detail="Quiz not found in this classroom")
+    answer_key = answer_key or AnswerKey(quiz_id, (), ())
+
+    analytics = quiz_analytics.get(quiz_id)
+    if rebuild or analytics is None or analytics.key != answer_key:
+        # Open the window before reading: rows pending now or acknowledged during the read
+        # are counted once, whether or not the read also sees them flushed
+        window = quiz_analytics.capture(quiz_id, [
+            (row.get("submission_key"), submitted_answers(row["answer"]))
+            for row in submission_buffer.pending_rows() if row["quiz_id"] == quiz_id
+        ])
+        try:
+            stored = await db.fetch_all(
+                lambda: supabase.table("quiz-submissions")
+                .select("answer, submission_key")
+                .eq("quiz_id", quiz_id)
+                .order("id"),
+                page_size=DB_PAGE_SIZE
+            )
+        except BaseException:
+            quiz_analytics.release(quiz_id, window)
+            raise
+        analytics = quiz_analytics.rebuild(
+            answer_key,
+            [(row.get("submission_key"), submitted_answers(row["answer"])) for row in stored],
+            window
+        )
+    return analytics
 
-        # Parse questions
-        questions = []
-        for block in raw_text.strip().split("Q:")[1:]:
-            lines = [line.strip() for line in block.strip().split("\n") if line.strip()]
-            if len(lines) < 6:
-                continue
-            
-            question_text = lines[0]
-            options = [
-                lines[1].replace("A:", "").strip(),
-                lines[2].replace("B:", "").strip(),
-                lines[3].replace("C:", "").strip(),
-                lines[4].replace("D:", "").strip()
-            ]
-            correct_letter = lines[5].replace("Correct:", "").strip().upper()
-            
-            if correct_letter not in {"A", "B", "C", "D"}:
-                continue
-            
-            correct_answer = [correct_letter]
-            
-            questions.append({
-                "question_text": question_text,
-                "options": options,
-                "correct_answer": correct_answer,
-                "type": "mcq"
-            })
+@app.get("/classroom/{classroom_id}/quiz/{quiz_id}/analytics")
+async def get_quiz_analytics(classroom_id: str, quiz_id: str, member: ClassroomMember = Depends(get_classroom_member)):
+    try:
+        if not member.is_teacher:
+            raise HTTPException(status_code=403, detail="Only teachers can view quiz analytics")
+        analytics = await load_quiz_analytics(classroom_id, quiz_id)
+        return {"status": "success", **analytics.snapshot()}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        if not questions:
-            raise HTTPException(status_code=400, detail="No valid questions generated. Please try with different content.")
+@app.post("/classroom/{classroom_id}/quiz/{quiz_id}/analytics/rebuild")
+async def rebuild_quiz_analytics(classroom_id: str, quiz_id: str, member: ClassroomMember = Depends(get_classroom_member)):
+    try:
+        if not member.is_teacher:
+            raise HTTPException(status_code=403, detail="Only teachers can rebuild quiz analytics")
+        analytics = await load_quiz_analytics(classroom_id, quiz_id, rebuild=True)
+        return {"status": "success", **analytics.snapshot()}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Get user ID from token
-        user = supabase.auth.get_user(access_token)
-        if not user or not user.user:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user_id = user.user.id
+@app.post("/generate-quiz")
+async def generate_quiz(
+    request: Request,
+    file: UploadFile = File(...),
+    name: str = Form(...),
+    num_questions: int = Form(...),
+    mcq: int = Form(...),
+    frq: int = Form(0),
+    classroom_id: str = Form(...),
+    regenerate: bool = Form(False),
+    pages: str = Form(""),
+    latency_budget: float | None = Form(None),
+    user: AuthUser = Depends(get_current_user)
+):
+    try:
+        validate_quiz_form(num_questions, mcq)
+        await require_classroom_teacher(classroom_id, user)
+        text_content = await read_upload_text(file, pages)
+        choice = choose_model(text_content, mcq, latency_budget)
 
+        cache_key = quiz_cache.key(text_content, choice.model, mcq, PROMPT_VERSION)
+        questions = None if regenerate else await quiz_cache.get(cache_key)
+        cached = questions is not None
 
-        # Create quiz
-        quiz_resp = supabase.table("quizzes").insert({
-            "user_id": user_id,
-            "name": name,
-            "classroom_id": classroom_id,
-            "is_completed": False
-        }).execute()
+        reused = 0
+        if not cached:
+            llm_scheduler.check_admission(INTERACTIVE)
+            plan = await plan_question_reuse(text_content, mcq, classroom_id, user.id, reuse=not regenerate)
+            reused = len(plan.reused)
+            questions = [question async for question in generate_with_reuse(plan, text_content, mcq, user.id, model=choice.model)]
 
-        quiz_id = quiz_resp.data[0]["id"]
+            if not questions:
+                raise HTTPException(status_code=400, detail="No valid questions generated. Please try with different content.")
+            await quiz_cache.put(cache_key, questions)
 
-        # Save questions
-        quiz_questions = []
-        for q in questions:
-            q["quiz_id"] = quiz_id
-            quiz_questions.append(q)
-        
-        if quiz_questions:
-            supabase.table("Q&A").insert(quiz_questions).execute()
+        quiz_id = await save_quiz(user.id, name, classroom_id, questions, model=choice.model)
 
         return {
             "status": "success",
             "quiz_id": quiz_id,
             "classroom_id": classroom_id,
             "questions_generated": len(questions),
+            "cached": cached,
+            "reused": reused,
+            "model": choice.model,
             "details": {
                 "name": name,
                 "total_questions": num_questions,
@@ -1023,16 +1579,198 @@ Make questions relevant to the content.
     except Exception as e:
         print(f"Error generating quiz: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/generate-quiz/stream")
+async def generate_quiz_stream(
+    file: UploadFile = File(...),
+    name: str = Form(...),
+    num_questions: int = Form(...),
+    mcq: int = Form(...),
+    frq: int = Form(0),
+    classroom_id: str = Form(...),
+    regenerate: bool = Form(False),
+    pages: str = Form(""),
+    latency_budget: float | None = Form(None),
+    user: AuthUser = Depends(get_current_user)
+):
+    """Same as /generate-quiz, but pushes each question over Server-Sent Events as soon as it is parsed"""
+    validate_quiz_form(num_questions, mcq)
+    await require_classroom_teacher(classroom_id, user)
+    text_content = await read_upload_text(file, pages)
+    choice = choose_model(text_content, mcq, latency_budget)
+    cache_key = quiz_cache.key(text_content, choice.model, mcq, PROMPT_VERSION)
+    cached_questions = None if regenerate else await quiz_cache.get(cache_key)
+    if cached_questions is None:
+        # Reject with a real 503 + Retry-After while we still can, before the stream starts
+        llm_scheduler.check_admission(INTERACTIVE)
+
+    async def event_stream():
+        questions = []
+        try:
+            if cached_questions is not None:
+                for question in cached_questions:
+                    questions.append(question)
+                    yield sse_event("question", {"index": len(questions) - 1, "question": question})
+            else:
+                plan = await plan_question_reuse(text_content, mcq, classroom_id, user.id, reuse=not regenerate)
+                async for question in generate_with_reuse(plan, text_content, mcq, user.id, model=choice.model):
+                    questions.append(question)
+                    yield sse_event("question", {"index": len(questions) - 1, "question": question})
+
+            if not questions:
+                yield sse_event("error", {"detail": "No valid questions generated. Please try with different content."})
+                return
+            if cached_questions is None:
+                await quiz_cache.put(cache_key, questions)
+
+            quiz_id = await save_quiz(user.id, name, classroom_id, questions, model=choice.model)
+            yield sse_event("done", {
+                "status": "success",
+                "quiz_id": quiz_id,
+                "classroom_id": classroom_id,
+                "questions_generated": len(questions),
+                "cached": cached_questions is not None,
+                "reused": len(plan.reused) if cached_questions is None else 0,
+                "model": choice.model
+            })
+        except Exception as e:
+            print(f"Error streaming quiz: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def run_quiz_job(job: dict, ctx: JobContext) -> dict:
+    """Background version of /generate-quiz: extraction, generation, parsing and the inserts"""
+    params = job["params"]
+    # Checked again here: the job may have waited in the queue after the caller lost the role
+    await require_classroom_teacher(params["classroom_id"], AuthUser(id=job["user_id"]))
+
+    await ctx.update(0.05, "extracting")
+    upload = IngestedUpload.from_path(job["upload_path"], job["filename"], sha256=params.get("upload_sha256"))
+    text_content = await extract_upload_text(upload, pages=parse_pages_field(params.get("pages", "")))
+
+    choice = choose_model(text_content, params["mcq"], params.get("latency_budget"))
+    cache_key = quiz_cache.key(text_content, choice.model, params["mcq"], PROMPT_VERSION)
+    questions = None if params.get("regenerate") else await quiz_cache.get(cache_key)
+    cached = questions is not None
+
+    reused = 0
+    if not cached:
+        await ctx.update(0.15, "generating")
+        plan = await plan_question_reuse(text_content, params["mcq"], params["classroom_id"], job["user_id"], priority=BULK, reuse=not params.get("regenerate"))
+        reused = len(plan.reused)
+        questions = []
+        async for question in generate_with_reuse(plan, text_content, params["mcq"], job["user_id"], priority=BULK, model=choice.model):
+            questions.append(question)
+            await ctx.update(
+                0.15 + 0.75 * min(len(questions) / max(params["mcq"], 1), 1.0),
+                f"generated {len(questions)} question(s)"
+            )
+
+        if not questions:
+            raise HTTPException(status_code=400, detail="No valid questions generated. Please try with different content.")
+        await quiz_cache.put(cache_key, questions)
+
+    await ctx.update(0.95, "saving")
+    quiz_id = await save_quiz(job["user_id"], params["name"], params["classroom_id"], questions, model=choice.model)
+    return {
+        "quiz_id": quiz_id,
+        "classroom_id": params["classroom_id"],
+        "questions_generated": len(questions),
+        "cached": cached,
+        "reused": reused,
+        "model": choice.model
+    }
+
+job_queue = JobQueue(
+    db_path=os.path.join(DATA_DIR, "jobs.sqlite3"),
+    upload_dir=os.path.join(DATA_DIR, "job_uploads"),
+    handler=run_quiz_job,
+    workers=QUIZ_JOB_WORKERS
+)
+
+@app.post("/generate-quiz/jobs", status_code=202)
+async def submit_quiz_job(
+    file: UploadFile = File(...),
+    name: str = Form(...),
+    num_questions: int = Form(...),
+    mcq: int = Form(...),
+    frq: int = Form(0),
+    classroom_id: str = Form(...),
+    regenerate: bool = Form(False),
+    pages: str = Form(""),
+    latency_budget: float | None = Form(None),
+    user: AuthUser = Depends(get_current_user)
+):
+    """Queue quiz generation and return a job id straight away"""
+    validate_quiz_form(num_questions, mcq)
+    await require_classroom_teacher(classroom_id, user)
+    validate_latency_budget(latency_budget)
+    parse_pages_field(pages)
+    upload = await receive_upload(file)
+    try:
+        job_id = await job_queue.submit(user.id, upload, {
+            "name": name,
+            "num_questions": num_questions,
+            "mcq": mcq,
+            "frq": frq,
+            "classroom_id": classroom_id,
+            "regenerate": regenerate,
+            "pages": pages,
+            "latency_budget": latency_budget,
+            "upload_sha256": upload.sha256
+        })
+    finally:
+        upload.cleanup()
+    return {"status": "queued", "job_id": job_id}
+
+async def get_owned_job(job_id: str, user: AuthUser) -> dict:
+    job = await job_queue.get(job_id)
+    if not job or job["user_id"] != user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/generate-quiz/jobs/{job_id}")
+async def get_quiz_job(job_id: str, user: AuthUser = Depends(get_current_user)):
+    job = await get_owned_job(job_id, user)
+    return {
+        "status": "success",
+        "job": {
+            "id": job["id"],
+            "status": job["status"],
+            "stage": job["stage"],
+            "progress": job["progress"],
+            "queue_position": job["queue_position"],
+            "result": job["result"],
+            "error": job["error"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"]
+        }
+    }
+
+@app.post("/generate-quiz/jobs/{job_id}/cancel")
+async def cancel_quiz_job(job_id: str, user: AuthUser = Depends(get_current_user)):
+    job = await get_owned_job(job_id, user)
+    if not await job_queue.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    return {"status": "success", "job_id": job_id}
+
 # question_text, options, correct_answer
 
 @app.post("/updated-generate-quiz")
 async def updated_generate_quiz(question: str, options: list, correct_answer: list, id: str):
-    supabase.table("Q&A").update({
+    await db.execute(supabase.table("Q&A").update({
         "question_text": question,
         "options": options,
         "correct_answer": correct_answer
-    }).eq("quiz_id", id).execute()
-    new_results = supabase.table("Q&A").select("question_text, options, correct_answer").eq("quiz_id", id).execute()
+    }).eq("quiz_id", id))
+    answer_keys.invalidate(id)
+    quiz_analytics.invalidate(id)
+    new_results = await db.execute(supabase.table("Q&A").select("question_text, options, correct_answer").eq("quiz_id", id))
 
     return {
         new_results.data
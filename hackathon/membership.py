@@ -0,0 +1,49 @@
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from auth import AuthUser
+from cache import TTLCache
+
+@dataclass
+class ClassroomMember:
+    """The caller, resolved against the classroom in the request path"""
+    user: AuthUser
+    classroom_id: str
+    role: str
+
+    @property
+    def is_teacher(self) -> bool:
+        return self.role == "teacher"
+
+class MembershipCache:
+    """Caches (user_id, classroom_id) -> role for authorization checks.
+
+    `fetch(user_id, classroom_id)` returns the role or None. Only memberships are cached, so
+    a user who joins is never locked out by a stale "not a member" answer; the TTL bounds how
+    long a removed member keeps access. join/create call `remember` with the role they wrote.
+    """
+
+    def __init__(self, fetch: Callable[[str, str], Awaitable[str | None]], maxsize: int = 50000, ttl: float = 120.0):
+        self._fetch = fetch
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get_role(self, user_id: str, classroom_id: str) -> str | None:
+        key = (user_id, classroom_id)
+        role = self._cache.get(key)
+        if role is None:
+            role = await self._fetch(user_id, classroom_id)
+            if role is not None:
+                self._cache.set(key, role)
+        return role
+
+    def remember(self, user_id: str, classroom_id: str, role: str):
+        self._cache.set((user_id, classroom_id), role)
+
+    def invalidate(self, user_id: str, classroom_id: str):
+        self._cache.pop((user_id, classroom_id))
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
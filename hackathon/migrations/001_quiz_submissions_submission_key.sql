@@ -0,0 +1,6 @@
+-- Idempotency key for buffered quiz submissions (submissions.py / flush_submissions).
+-- A batch replayed after a crash is upserted with ignore_duplicates, so rows already
+-- inserted are skipped. Existing rows keep a NULL key, which never conflicts.
+alter table "quiz-submissions" add column if not exists submission_key uuid;
+create unique index if not exists "quiz-submissions_submission_key_key"
+    on "quiz-submissions" (submission_key);
@@ -0,0 +1,4 @@
+-- Which Ollama model wrote a quiz's questions (save_quiz), for comparing quality across
+-- model tiers. Apply before deploying: inserts that name an unknown column are rejected.
+-- Quizzes created earlier keep a NULL model.
+alter table quizzes add column if not exists model text;
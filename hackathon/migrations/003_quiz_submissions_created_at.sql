@@ -0,0 +1,5 @@
+-- When a submission was made (submit_quiz_results sets it at submit time, before buffering).
+-- The gradebook orders attempts by (created_at, id) to find each student's latest one.
+alter table "quiz-submissions" add column if not exists created_at timestamptz not null default now();
+create index if not exists "quiz-submissions_quiz_id_created_at_idx"
+    on "quiz-submissions" (quiz_id, created_at, id);
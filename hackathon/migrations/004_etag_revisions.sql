@@ -0,0 +1,74 @@
+-- Version stamps behind the ETags on GET /classroom/{id} and GET /classroom/{id}/quiz/{id}.
+-- Triggers bump classroom.revision whenever anything in the classroom response changes
+-- (the classroom, its members or their profiles, its quiz list), and quizzes.revision
+-- whenever anything in the quiz response changes (the quiz, its questions, submissions).
+-- Deletes and writes from other workers or the dashboard are covered too, since the
+-- counters live in the database.
+alter table classroom add column if not exists revision bigint not null default 0;
+alter table quizzes add column if not exists revision bigint not null default 0;
+
+-- Own-column edits: bump the row being updated
+create or replace function bump_own_revision() returns trigger language plpgsql as $$
+begin
+    new.revision := old.revision + 1;
+    return new;
+end $$;
+
+drop trigger if exists classroom_revision on classroom;
+create trigger classroom_revision before update of name, teacher_id on classroom
+    for each row execute function bump_own_revision();
+
+drop trigger if exists quizzes_revision on quizzes;
+create trigger quizzes_revision before update of name, is_completed, classroom_id on quizzes
+    for each row execute function bump_own_revision();
+
+-- Child rows: bump the parent they belong to (both parents when a row moves)
+create or replace function bump_classroom_revision() returns trigger language plpgsql as $$
+begin
+    if tg_op <> 'INSERT' then
+        update classroom set revision = revision + 1 where id = old.classroom_id;
+    end if;
+    if tg_op = 'INSERT' or (tg_op = 'UPDATE' and new.classroom_id is distinct from old.classroom_id) then
+        update classroom set revision = revision + 1 where id = new.classroom_id;
+    end if;
+    return null;
+end $$;
+
+drop trigger if exists classroom_members_revision on classroom_members;
+create trigger classroom_members_revision after insert or update or delete on classroom_members
+    for each row execute function bump_classroom_revision();
+
+drop trigger if exists quizzes_classroom_revision on quizzes;
+create trigger quizzes_classroom_revision after insert or delete or update of name, is_completed, classroom_id on quizzes
+    for each row execute function bump_classroom_revision();
+
+create or replace function bump_quiz_revision() returns trigger language plpgsql as $$
+begin
+    if tg_op <> 'INSERT' then
+        update quizzes set revision = revision + 1 where id = old.quiz_id;
+    end if;
+    if tg_op = 'INSERT' or (tg_op = 'UPDATE' and new.quiz_id is distinct from old.quiz_id) then
+        update quizzes set revision = revision + 1 where id = new.quiz_id;
+    end if;
+    return null;
+end $$;
+
+drop trigger if exists qa_revision on "Q&A";
+create trigger qa_revision after insert or update or delete on "Q&A"
+    for each row execute function bump_quiz_revision();
+
+drop trigger if exists quiz_submissions_revision on "quiz-submissions";
+create trigger quiz_submissions_revision after insert or update or delete on "quiz-submissions"
+    for each row execute function bump_quiz_revision();
+
+-- Member names and pictures are embedded in the classroom response
+create or replace function bump_member_classrooms_revision() returns trigger language plpgsql as $$
+begin
+    update classroom set revision = revision + 1
+    where id in (select classroom_id from classroom_members where user_id = new.id);
+    return null;
+end $$;
+
+drop trigger if exists client_profile_revision on "clientProfile";
+create trigger client_profile_revision after update of first_name, last_name, image_url, pronouns on "clientProfile"
+    for each row execute function bump_member_classrooms_revision();
@@ -0,0 +1,239 @@
+import asyncio
+import time
+
+import httpx
+import ollama
+from fastapi import HTTPException
+
+def _field(chunk, name: str):
+    return chunk.get(name) if hasattr(chunk, "get") else getattr(chunk, name, None)
+
+def _is_failover_error(error: Exception) -> bool:
+    """Errors that say "this host is unusable", as opposed to a bad request"""
+    if isinstance(error, (ConnectionError, httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    return isinstance(error, ollama.ResponseError) and error.status_code >= 500
+
+class OllamaBackend:
+    """One Ollama host with its health, load and performance counters"""
+
+    def __init__(self, url: str, timeout: float | None = None):
+        self.url = url.rstrip("/")
+        self.client = ollama.AsyncClient(host=self.url, timeout=timeout)
+        self.healthy = True # Optimistic until the first probe says otherwise
+        self.loaded_models: set[str] = set()
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_error: str | None = None
+        self.last_probe: float | None = None
+        self.total_latency = 0.0
+        self.total_first_token = 0.0
+        self.completed = 0
+        self.eval_tokens = 0
+        self.eval_seconds = 0.0
+
+    def has_model(self, model: str) -> bool:
+        return model in self.loaded_models
+
+    def mark_down(self, error: Exception):
+        self.healthy = False
+        self.failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "loaded_models": sorted(self.loaded_models),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "avg_latency_ms": round(self.total_latency / self.completed * 1000, 2) if self.completed else None,
+            "avg_first_token_ms": round(self.total_first_token / self.completed * 1000, 2) if self.completed else None,
+            "tokens_per_second": round(self.eval_tokens / self.eval_seconds, 2) if self.eval_seconds else None,
+            "seconds_since_probe": round(time.time() - self.last_probe, 1) if self.last_probe else None
+        }
+
+class OllamaPool:
+    """Routes Ollama calls across several hosts.
+
+    A probe loop checks every `probe_interval` seconds that each host answers /api/tags and
+    which models it has resident (/api/ps). Calls go to the healthy host with the fewest
+    outstanding requests, with hosts that would have to load the model first counted as
+    `cold_penalty` requests busier. Every call carries `keep_alive`. If a host fails before
+    streaming anything it is marked down and the call moves to the next one;
+    once tokens have been yielded the error is raised, since replaying would duplicate output.
+    `request_timeout` bounds each read from a host, and a stream with no first chunk within
+    it counts as a failed host, so a hung backend fails over instead of holding the call.
+    """
+
+    def __init__(
+        self,
+        urls: list[str],
+        probe_interval: float = 15.0,
+        probe_timeout: float = 3.0,
+        request_timeout: float | None = None,
+        cold_penalty: int = 2,
+        keep_alive: str | float | None = None
+    ):
+        if not urls:
+            raise ValueError("OllamaPool needs at least one backend URL")
+        self.backends = [OllamaBackend(url, timeout=request_timeout) for url in urls]
+        self.request_timeout = request_timeout
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.cold_penalty = cold_penalty
+        self.keep_alive = keep_alive # Sent with every call so hosts keep the model resident between calls
+        self.failovers = 0
+        self._probe_task: asyncio.Task | None = None
+
+    # Lifecycle
+    async def start(self):
+        await self.probe_all()
+        self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def shutdown(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+            self._probe_task = None
+
+    # Health
+    async def probe_all(self):
+        await asyncio.gather(*(self._probe(backend) for backend in self.backends))
+
+    async def _probe_loop(self):
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            await self.probe_all()
+
+    async def _probe(self, backend: OllamaBackend):
+        try:
+            await asyncio.wait_for(backend.client.list(), self.probe_timeout)
+            running = await asyncio.wait_for(backend.client.ps(), self.probe_timeout)
+            backend.loaded_models = {model.model for model in running.models}
+            if not backend.healthy:
+                print(f"Ollama backend {backend.url} is back up")
+            backend.healthy = True
+        except Exception as e:
+            if backend.healthy:
+                print(f"Ollama backend {backend.url} failed its health probe: {e}")
+            backend.healthy = False
+            backend.loaded_models = set()
+            backend.last_error = f"{type(e).__name__}: {e}"
+        backend.last_probe = time.time()
+
+    # Routing
+    def pick(self, model: str, exclude: set | frozenset = frozenset()) -> OllamaBackend | None:
+        candidates = [backend for backend in self.backends if backend not in exclude]
+        if not candidates:
+            return None
+        # Healthy first (a stale "down" may have recovered, so down hosts are a last resort),
+        # then fewest outstanding, counting a host without the model resident as `cold_penalty`
+        # requests busier since it must load it first, then fastest so far
+        return min(candidates, key=lambda backend: (
+            not backend.healthy,
+            backend.outstanding + (0 if backend.has_model(model) else self.cold_penalty),
+            backend.total_latency / backend.completed if backend.completed else 0.0
+        ))
+
+    async def generate(self, model: str, **kwargs):
+        """Streaming generate on the least-loaded backend, failing over on connection errors"""
+        tried = set()
+        while True:
+            backend = self.pick(model, tried)
+            if backend is None:
+                raise HTTPException(status_code=503, detail="No Ollama backend is reachable")
+            tried.add(backend)
+
+            backend.outstanding += 1
+            backend.requests += 1
+            started = time.perf_counter()
+            first_token = None
+            try:
+                stream = aiter(await backend.client.generate(model=model, stream=True, keep_alive=self.keep_alive, **kwargs))
+                # A host that accepts the call but never streams raises TimeoutError here and is failed over
+                chunk = await asyncio.wait_for(anext(stream, None), self.request_timeout)
+                first_token = time.perf_counter() - started
+                while chunk is not None:
+                    if _field(chunk, "done") and _field(chunk, "eval_duration"):
+                        backend.eval_tokens += _field(chunk, "eval_count") or 0
+                        backend.eval_seconds += _field(chunk, "eval_duration") / 1e9
+                    yield chunk
+                    chunk = await anext(stream, None)
+            except Exception as e:
+                if not _is_failover_error(e):
+                    raise
+                backend.mark_down(e)
+                if first_token is not None:
+                    raise
+                self.failovers += 1
+                print(f"Ollama backend {backend.url} failed ({backend.last_error}); failing over")
+                continue
+            finally:
+                backend.outstanding -= 1
+
+            backend.completed += 1
+            backend.total_latency += time.perf_counter() - started
+            backend.total_first_token += first_token or 0.0
+            if backend.healthy and model not in backend.loaded_models:
+                # A successful call leaves the model resident; saves waiting for the next probe
+                backend.loaded_models.add(model)
+            return
+
+    async def embed(self, model: str, input: list[str]):
+        """Embeddings from the least-loaded backend, with the same failover as `generate`"""
+        tried = set()
+        while True:
+            backend = self.pick(model, tried)
+            if backend is None:
+                raise HTTPException(status_code=503, detail="No Ollama backend is reachable")
+            tried.add(backend)
+
+            backend.outstanding += 1
+            backend.requests += 1
+            try:
+                response = await backend.client.embed(model=model, input=input, keep_alive=self.keep_alive)
+            except Exception as e:
+                if not _is_failover_error(e):
+                    raise
+                backend.mark_down(e)
+                self.failovers += 1
+                print(f"Ollama backend {backend.url} failed ({backend.last_error}); failing over")
+                continue
+            finally:
+                backend.outstanding -= 1
+
+            # Latency stats stay generation-only; an embedding call is far cheaper
+            backend.loaded_models.add(model)
+            return response
+
+    async def warm(self, model: str) -> int:
+        """Load `model` on every healthy host (an empty prompt only loads); returns how many have it"""
+        async def warm_one(backend: OllamaBackend) -> bool:
+            try:
+                await backend.client.generate(model=model, prompt="", keep_alive=self.keep_alive)
+            except Exception as e:
+                if _is_failover_error(e):
+                    backend.mark_down(e)
+                print(f"Warming {model} on {backend.url} failed: {e}")
+                return False
+            backend.loaded_models.add(model)
+            return True
+
+        healthy = [backend for backend in self.backends if backend.healthy]
+        return sum(await asyncio.gather(*(warm_one(backend) for backend in healthy)))
+
+    def resident(self, model: str) -> list[str]:
+        """URLs of healthy hosts that currently have `model` loaded"""
+        return [backend.url for backend in self.backends if backend.healthy and backend.has_model(model)]
+
+    def stats(self) -> dict:
+        return {
+            "failovers": self.failovers,
+            "keep_alive": self.keep_alive,
+            "healthy": sum(1 for backend in self.backends if backend.healthy),
+            "backends": [backend.stats() for backend in self.backends]
+        }
@@ -0,0 +1,56 @@
+import base64
+import json
+from datetime import datetime
+from uuid import UUID
+
+from fastapi import HTTPException
+
+def encode_cursor(row: dict, key: str, tiebreak: str) -> str:
+    payload = json.dumps([row[key], row[tiebreak]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    """(timestamp, uuid) from a cursor, both re-serialised canonically.
+
+    The values end up inside a PostgREST filter string, so anything that doesn't parse as an
+    ISO timestamp and a uuid is rejected rather than passed through.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, tiebreak = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(value).isoformat(), str(UUID(tiebreak))
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset(query, key: str, tiebreak: str, cursor: str | None, limit: int | None):
+    """Order `query` by (key, tiebreak) and resume after `cursor`.
+
+    `key` must be a timestamp column and `tiebreak` a uuid column (see `decode_cursor`). Fetches one row beyond `limit` so `page` can tell whether another page exists.
+    Without a limit the whole (remaining) result is returned.
+    """
+    query = query.order(key).order(tiebreak)
+    if cursor:
+        value, tie = decode_cursor(cursor)
+        # Quoted because timestamps contain characters PostgREST treats as syntax
+        query = query.or_(f'{key}.gt."{value}",and({key}.eq."{value}",{tiebreak}.gt."{tie}")')
+    if limit is not None:
+        query = query.limit(limit + 1)
+    return query
+
+def page(rows: list[dict], key: str, tiebreak: str, limit: int | None) -> tuple[list[dict], str | None]:
+    """Trim the look-ahead row from a `keyset` result; returns (rows, next_cursor)"""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1], key, tiebreak)
+
+def parse_include(include: str, allowed: tuple[str, ...]) -> set[str]:
+    """"members,quizzes" -> {"members", "quizzes"}; 400 on unknown sections"""
+    sections = {part.strip() for part in include.split(",") if part.strip()}
+    unknown = sections - set(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown include section(s): {', '.join(sorted(unknown))}. Allowed: {', '.join(allowed)}"
+        )
+    return sections
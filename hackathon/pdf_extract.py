@@ -0,0 +1,101 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+def parse_page_ranges(spec: str, max_page: int = 5000) -> list[int] | None:
+    """Turn "1-5, 8, 10-12" (1-based, inclusive) into sorted 0-based page numbers; "" means all pages.
+
+    Pages above `max_page` are rejected before any range is expanded, so a huge range can't
+    build a huge set.
+    """
+    spec = (spec or "").strip()
+    if not spec:
+        return None
+
+    pages = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = end = int(part)
+        if start < 1 or end < start or end > max_page:
+            raise ValueError(f"Invalid page range: {part}")
+        pages.update(range(start - 1, end))
+    return sorted(pages)
+
+# These run inside the worker processes, so they only import pdfminer
+def _count_pages(path: str) -> int:
+    from pdfminer.pdfpage import PDFPage
+    with open(path, "rb") as f:
+        return sum(1 for _ in PDFPage.get_pages(f))
+
+def _extract_pages(path: str, page_numbers: list[int]) -> str:
+    from pdfminer.high_level import extract_text
+    return extract_text(path, page_numbers=page_numbers)
+
+class PdfExtractor:
+    """Extracts PDF text page-range by page-range on a process pool.
+
+    pdfminer is pure Python and CPU-bound, so running it in-process stalls the event loop.
+    Chunks are submitted in document order with at most `max_workers` in flight, and
+    extraction stops as soon as `char_budget` characters have been collected.
+    """
+
+    def __init__(self, max_workers: int = 2, pages_per_chunk: int = 8):
+        self.max_workers = max_workers
+        self.pages_per_chunk = pages_per_chunk
+        self._pool: ProcessPoolExecutor | None = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn keeps the children free of the parent's threads and open sockets
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def extract(self, path: str, pages: list[int] | None = None, char_budget: int | None = None) -> str:
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+
+        page_count = await loop.run_in_executor(pool, _count_pages, path)
+        if pages is None:
+            pages = list(range(page_count))
+        else:
+            pages = [p for p in pages if p < page_count]
+        if not pages:
+            return ""
+
+        chunks = [pages[i:i + self.pages_per_chunk] for i in range(0, len(pages), self.pages_per_chunk)]
+        futures = []
+        parts = []
+        collected = 0
+        next_chunk = 0
+        try:
+            for index in range(len(chunks)):
+                # Keep the pool busy without racing far past the budget
+                while next_chunk < len(chunks) and next_chunk < index + self.max_workers:
+                    futures.append(loop.run_in_executor(pool, _extract_pages, path, chunks[next_chunk]))
+                    next_chunk += 1
+
+                text = await futures[index]
+                parts.append(text)
+                collected += len(text)
+                if char_budget is not None and collected >= char_budget:
+                    print(f"PDF extraction stopped after {sum(len(c) for c in chunks[:index + 1])} of {len(pages)} pages (budget reached)")
+                    break
+        finally:
+            for future in futures:
+                future.cancel()
+
+        return "".join(parts)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,78 @@
+from typing import Awaitable, Callable, Iterable
+
+from cache import TTLCache
+
+PROFILE_FIELDS = ("first_name", "last_name", "image_url", "pronouns")
+
+# Stored for ids that have no clientProfile row so repeated lookups don't hit the database
+_NO_PROFILE = object()
+_MISSING = object()
+
+class ProfileCache:
+    """Read-through cache of clientProfile rows keyed by user id.
+
+    `fetch(ids)` loads the rows for the ids that missed in one batched query. Ids with no
+    row are cached as missing for `negative_ttl`, which is kept short because a profile can
+    appear later. Writes to clientProfile must call `invalidate`.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[list[str]], Awaitable[list[dict]]],
+        maxsize: int = 10000,
+        ttl: float = 600.0,
+        negative_ttl: float = 30.0
+    ):
+        self._fetch = fetch
+        self.negative_ttl = negative_ttl
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.fetches = 0
+        self.negative_hits = 0
+
+    async def get(self, user_id: str) -> dict | None:
+        return (await self.get_many([user_id])).get(user_id)
+
+    async def get_many(self, user_ids: Iterable[str]) -> dict[str, dict]:
+        """Profiles for `user_ids` by id; ids without a profile are left out"""
+        found = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            profile = self._cache.get(user_id, _MISSING)
+            if profile is _MISSING:
+                missing.append(user_id)
+            elif profile is _NO_PROFILE:
+                self.negative_hits += 1
+            else:
+                found[user_id] = profile
+
+        if missing:
+            self.fetches += 1
+            rows = await self._fetch(missing)
+            for row in rows:
+                found[row["id"]] = self.prime(row["id"], row)
+            for user_id in missing:
+                if user_id not in found:
+                    self._cache.set(user_id, _NO_PROFILE, ttl=self.negative_ttl)
+        return found
+
+    def prime(self, user_id: str, row: dict | None) -> dict | None:
+        """Cache a profile that arrived some other way (e.g. embedded in a members query)"""
+        if not row:
+            return None
+        profile = {field: row.get(field) for field in PROFILE_FIELDS}
+        self._cache.set(user_id, profile)
+        return profile
+
+    def invalidate(self, user_id: str):
+        self._cache.pop(user_id)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return {
+            **self._cache.stats(),
+            "negative_hits": self.negative_hits,
+            "fetches": self.fetches,
+            "negative_ttl_seconds": self.negative_ttl
+        }
@@ -0,0 +1,224 @@
+import asyncio
+import json
+import os
+from dataclasses import dataclass, field
+from threading import Lock
+
+import numpy as np
+
+def normalize(vectors) -> np.ndarray:
+    """Unit-length float32 rows, so cosine similarity is a plain dot product"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def fingerprint(question: dict) -> str:
+    return " ".join(question["question_text"].lower().split())
+
+@dataclass
+class ReusePlan:
+    """Which of a new document's sections are already covered by banked questions"""
+    classroom_id: str
+    sections: list[str]
+    vectors: np.ndarray | None = None # One normalised embedding per section
+    matched: list[bool] = field(default_factory=list)
+    reused: list[dict] = field(default_factory=list)
+
+    @property
+    def remaining_text(self) -> str | None:
+        """Text of the unmatched sections, for generating the shortfall; None means the whole document"""
+        unmatched = [section for section, hit in zip(self.sections, self.matched) if not hit]
+        if not self.matched or not unmatched:
+            return None
+        return "\n\n".join(unmatched)
+
+class QuestionBank:
+    """Embedding index of generated questions and the document chunks they came from.
+
+    Chunk and question embeddings are kept as normalised NumPy matrices, searched by brute
+    force cosine similarity, and scoped by classroom so one teacher's material is never
+    offered to another. The index is small (a row per section and per question), so each
+    `add` rewrites the .npy files next to a JSON file of row metadata; swapping in an ANN
+    index would only change `_search`. Changing `model` (the embedding model) starts a
+    fresh index, since vectors from different models aren't comparable.
+    """
+
+    def __init__(self, path: str, model: str, match_threshold: float = 0.9, duplicate_threshold: float = 0.95):
+        self.path = path
+        self.model = model
+        self.match_threshold = match_threshold # A new section this close to a banked chunk counts as already covered
+        self.duplicate_threshold = duplicate_threshold # Questions this close are treated as the same question
+        self._lock = Lock()
+        self._save_lock = Lock()
+        self._version = 0
+        self._saved_version = 0
+        self._chunks = np.zeros((0, 0), dtype=np.float32)
+        self._chunk_classrooms: list[str] = []
+        self._questions = np.zeros((0, 0), dtype=np.float32)
+        self._question_entries: list[dict] = [] # {"classroom_id", "chunk", "question"}
+        self.plans = 0
+        self.sections_matched = 0
+        self.sections_seen = 0
+        self.reused = 0
+        self.added = 0
+
+    # Persistence
+    async def start(self):
+        await asyncio.to_thread(self._load)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        os.makedirs(self.path, exist_ok=True)
+        try:
+            with open(self._file("entries.json")) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        if entries.get("model") != self.model:
+            print(f"Question bank was built with {entries.get('model')}, starting a fresh one for {self.model}")
+            return
+        with self._lock:
+            self._chunks = np.load(self._file("chunks.npy"))
+            self._questions = np.load(self._file("questions.npy"))
+            self._chunk_classrooms = entries["chunks"]
+            self._question_entries = entries["questions"]
+
+    def _save(self, version: int, chunks: np.ndarray, questions: np.ndarray, entries: dict):
+        with self._save_lock:
+            if version <= self._saved_version:
+                return # A later add already wrote a newer snapshot
+            self._write(chunks, questions, entries)
+            self._saved_version = version
+
+    def _write(self, chunks: np.ndarray, questions: np.ndarray, entries: dict):
+        # Write everything to temporary names first so a crash never leaves a mismatched set
+        for name, array in (("chunks.npy", chunks), ("questions.npy", questions)):
+            with open(self._file(name + ".tmp"), "wb") as f:
+                np.save(f, array)
+        with open(self._file("entries.json.tmp"), "w") as f:
+            json.dump(entries, f)
+        for name in ("chunks.npy", "questions.npy", "entries.json"):
+            os.replace(self._file(name + ".tmp"), self._file(name))
+
+    # Search
+    def _search(self, matrix: np.ndarray, owners: list[str], classroom_id: str, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Best row (or -1) and its similarity for each vector, among rows owned by the classroom"""
+        best = np.full(len(vectors), -1)
+        scores = np.zeros(len(vectors), dtype=np.float32)
+        if not len(matrix) or matrix.shape[1] != vectors.shape[1]:
+            return best, scores
+        rows = np.flatnonzero(np.array(owners) == classroom_id)
+        if not len(rows):
+            return best, scores
+        similarity = vectors @ matrix[rows].T
+        columns = similarity.argmax(axis=1)
+        return rows[columns], similarity[np.arange(len(vectors)), columns]
+
+    def has_chunks(self, classroom_id: str) -> bool:
+        """Whether anything is banked for the classroom; if not, a plan can't match and needs no embeddings"""
+        with self._lock:
+            return classroom_id in self._chunk_classrooms
+
+    def plan(self, classroom_id: str, sections: list[str], vectors, mcq: int) -> ReusePlan:
+        """Reuse banked questions for sections that match indexed chunks.
+
+        Matched sections earn their share of the quiz (mcq * matched / sections, rounded);
+        questions are drawn round-robin from the matched chunks, skipping near-duplicates.
+        """
+        vectors = normalize(vectors)
+        with self._lock:
+            best, scores = self._search(self._chunks, self._chunk_classrooms, classroom_id, vectors)
+            matched = [bool(score >= self.match_threshold) for score in scores]
+            share = round(mcq * sum(matched) / len(sections)) if sections else 0
+
+            by_chunk: dict[int, list[int]] = {}
+            for index, entry in enumerate(self._question_entries):
+                if entry["classroom_id"] == classroom_id:
+                    by_chunk.setdefault(entry["chunk"], []).append(index)
+            queues = [list(by_chunk.get(int(chunk), [])) for chunk, hit in zip(best, matched) if hit]
+
+            picked: list[int] = []
+            seen: set[str] = set()
+            while len(picked) < share and any(queues):
+                for queue in queues:
+                    if not queue or len(picked) >= share:
+                        continue
+                    index = queue.pop(0)
+                    question = self._question_entries[index]["question"]
+                    if fingerprint(question) in seen:
+                        continue
+                    if picked and float((self._questions[picked] @ self._questions[index]).max()) >= self.duplicate_threshold:
+                        continue
+                    seen.add(fingerprint(question))
+                    picked.append(index)
+            reused = [self._question_entries[index]["question"] for index in picked]
+
+        self.plans += 1
+        self.sections_seen += len(sections)
+        self.sections_matched += sum(matched)
+        self.reused += len(reused)
+        return ReusePlan(classroom_id, sections, vectors, matched, reused)
+
+    async def add(self, plan: ReusePlan, questions: list[dict], question_vectors):
+        """Index newly generated questions under the section of `plan` each is closest to"""
+        if not questions or plan.vectors is None:
+            return
+        question_vectors = normalize(question_vectors)
+        sources = (question_vectors @ plan.vectors.T).argmax(axis=1)
+
+        with self._lock:
+            chunks, chunk_classrooms = self._chunks, list(self._chunk_classrooms)
+            banked, entries = self._questions, list(self._question_entries)
+            if len(chunks) and chunks.shape[1] != plan.vectors.shape[1]:
+                # The embedding model changed dimension under the same name; start over
+                chunks, chunk_classrooms = np.zeros((0, 0), dtype=np.float32), []
+                banked, entries = np.zeros((0, 0), dtype=np.float32), []
+
+            # Sections already in the bank keep their chunk; new ones are appended
+            best, scores = self._search(chunks, chunk_classrooms, plan.classroom_id, plan.vectors)
+            chunk_ids: dict[int, int] = {}
+            new_chunks = []
+            for section in sorted(set(int(source) for source in sources)):
+                if scores[section] >= self.match_threshold:
+                    chunk_ids[section] = int(best[section])
+                else:
+                    chunk_ids[section] = len(chunk_classrooms) + len(new_chunks)
+                    new_chunks.append(section)
+
+            duplicate, duplicate_scores = self._search(banked, [entry["classroom_id"] for entry in entries], plan.classroom_id, question_vectors)
+            keep = [index for index in range(len(questions)) if duplicate_scores[index] < self.duplicate_threshold]
+            if not keep:
+                return
+
+            if new_chunks:
+                chunks = np.vstack([chunks.reshape(-1, plan.vectors.shape[1]), plan.vectors[new_chunks]])
+                chunk_classrooms += [plan.classroom_id] * len(new_chunks)
+            banked = np.vstack([banked.reshape(-1, question_vectors.shape[1]), question_vectors[keep]])
+            entries += [
+                {"classroom_id": plan.classroom_id, "chunk": chunk_ids[int(sources[index])], "question": questions[index]}
+                for index in keep
+            ]
+            self._chunks, self._chunk_classrooms = chunks, chunk_classrooms
+            self._questions, self._question_entries = banked, entries
+            self.added += len(keep)
+            self._version += 1
+            version = self._version
+            snapshot = {"model": self.model, "chunks": chunk_classrooms, "questions": entries}
+
+        await asyncio.to_thread(self._save, version, chunks, banked, snapshot)
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "chunks": len(self._chunk_classrooms),
+            "questions": len(self._question_entries),
+            "plans": self.plans,
+            "sections_matched": self.sections_matched,
+            "sections_seen": self.sections_seen,
+            "reused": self.reused,
+            "added": self.added
+        }
@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from threading import Lock
+
+from cache import TTLCache
+
+class QuizCache:
+    """Content-addressed cache of generated questions.
+
+    Keys are sha256(extracted text) plus the model, question count and prompt version, so the
+    same document uploaded to several classrooms is generated once. A small in-memory LRU sits
+    in front of a SQLite file that survives restarts; both tiers honour the same TTL, and the
+    disk tier evicts least-recently-used entries beyond `max_entries`.
+    """
+
+    def __init__(self, db_path: str, ttl: float = 7 * 24 * 3600, max_entries: int = 5000, memory_entries: int = 256):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._memory = TTLCache(maxsize=memory_entries, ttl=ttl)
+        self._conn: sqlite3.Connection | None = None
+        self._lock = Lock()
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(text_content: str, model: str, mcq: int, prompt_version: int) -> str:
+        text_hash = hashlib.sha256(text_content.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{text_hash}|{model}|{mcq}|v{prompt_version}".encode()).hexdigest()
+
+    async def get(self, key: str) -> list[dict] | None:
+        questions = self._memory.get(key)
+        if questions is not None:
+            return questions
+
+        entry = await asyncio.to_thread(self._get_from_disk, key)
+        if entry is None:
+            self.disk_misses += 1
+            return None
+        self.disk_hits += 1
+        questions, created_at = entry
+        self._memory.set(key, questions, ttl=created_at + self.ttl - time.time())
+        return questions
+
+    async def put(self, key: str, questions: list[dict]):
+        if not questions:
+            return
+        self._memory.set(key, questions)
+        await asyncio.to_thread(self._put_on_disk, key, questions)
+
+    async def invalidate(self, key: str):
+        self._memory.pop(key)
+        await asyncio.to_thread(self._execute, "DELETE FROM quiz_cache WHERE key = ?", (key,))
+
+    def stats(self) -> dict:
+        return {
+            "memory": self._memory.stats(),
+            "disk_hits": self.disk_hits,
+            "disk_misses": self.disk_misses,
+            "disk_evictions": self.evictions,
+            "ttl_seconds": self.ttl,
+            "max_entries": self.max_entries
+        }
+
+    # SQLite backend
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.db_path):
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS quiz_cache (
+                    key TEXT PRIMARY KEY,
+                    questions TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS quiz_cache_last_access ON quiz_cache (last_access)")
+            self._conn.commit()
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(sql, params).fetchall()
+            conn.commit()
+            return rows
+
+    def _get_from_disk(self, key: str) -> tuple[list[dict], float] | None:
+        now = time.time()
+        rows = self._execute("SELECT questions, created_at FROM quiz_cache WHERE key = ?", (key,))
+        if not rows:
+            return None
+        questions, created_at = rows[0]
+        if created_at + self.ttl <= now:
+            self._execute("DELETE FROM quiz_cache WHERE key = ?", (key,))
+            return None
+        self._execute("UPDATE quiz_cache SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(questions), created_at
+
+    def _put_on_disk(self, key: str, questions: list[dict]):
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO quiz_cache (key, questions, created_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(questions), now, now)
+        )
+        self._execute("DELETE FROM quiz_cache WHERE created_at <= ?", (now - self.ttl,))
+        count = self._execute("SELECT COUNT(*) FROM quiz_cache")[0][0]
+        if count > self.max_entries:
+            overflow = count - self.max_entries
+            self._execute(
+                "DELETE FROM quiz_cache WHERE key IN (SELECT key FROM quiz_cache ORDER BY last_access LIMIT ?)",
+                (overflow,)
+            )
+            self.evictions += overflow
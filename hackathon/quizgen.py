@@ -0,0 +1,273 @@
+import json
+from threading import Lock
+
+QUIZ_MODEL = "gpt-oss:120b"
+PROMPT_VERSION = 3 # Bump whenever build_prompt, the schema or the parser changes, so cached quizzes are regenerated
+VALID_LETTERS = {"A", "B", "C", "D"}
+CHARS_PER_TOKEN = 4 # Rough estimate, good enough for budgeting prompts
+
+def quiz_schema(mcq: int) -> dict:
+    """JSON schema passed as Ollama's `format`, which constrains decoding to match it"""
+    return {
+        "type": "object",
+        "properties": {
+            "questions": {
+                "type": "array",
+                "minItems": mcq,
+                "maxItems": mcq,
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "question_text": {"type": "string"},
+                        "options": {"type": "array", "items": {"type": "string"}, "minItems": 4, "maxItems": 4},
+                        "correct_answer": {"type": "string", "enum": sorted(VALID_LETTERS)}
+                    },
+                    "required": ["question_text", "options", "correct_answer"]
+                }
+            }
+        },
+        "required": ["questions"]
+    }
+
+def build_prompt(text_content: str, mcq: int) -> str:
+    return f"""
+Based on this content, generate exactly {mcq} multiple-choice questions:
+
+{text_content}
+
+Each question must have:
+- Clear question text
+- 4 options, in order A, B, C, D
+- One correct answer, given as the LETTER of the correct option (A, B, C or D), not its text
+
+Respond with JSON only, in this shape:
+{{"questions": [{{"question_text": "...", "options": ["...", "...", "...", "..."], "correct_answer": "A"}}]}}
+
+Make questions relevant to the content.
+"""
+
+def validate_question(item) -> dict | None:
+    """Turn one decoded question object into a question row, or None if it is unusable"""
+    if not isinstance(item, dict):
+        return None
+    question_text = item.get("question_text")
+    options = item.get("options")
+    correct = item.get("correct_answer")
+    if not isinstance(question_text, str) or not question_text.strip():
+        return None
+    if not isinstance(options, list) or len(options) != 4:
+        return None
+    options = [str(option).strip() for option in options]
+    if not all(options):
+        return None
+
+    if isinstance(correct, list) and len(correct) == 1:
+        correct = correct[0]
+    correct_letter = str(correct or "").strip().upper().rstrip(").:")
+    if correct_letter not in VALID_LETTERS:
+        # Some models answer with the option text despite the schema
+        matches = [i for i, option in enumerate(options) if option.lower() == str(correct or "").strip().lower()]
+        if len(matches) != 1:
+            return None
+        correct_letter = "ABCD"[matches[0]]
+
+    return {
+        "question_text": question_text.strip(),
+        "options": options,
+        "correct_answer": [correct_letter],
+        "type": "mcq"
+    }
+
+class QuestionStreamParser:
+    """Incrementally parses streamed JSON output, yielding each question object as soon as it closes.
+
+    Only tracks string/escape state and container nesting, so it never re-scans earlier
+    text. Any object directly inside the top-level "questions" array (or a bare top-level
+    array) is decoded and validated on its own, so one bad question never costs the others.
+    """
+
+    def __init__(self):
+        self._stack: list[str] = [] # Open containers: "{" or "["
+        self._in_string = False
+        self._escaped = False
+        self._current: list[str] | None = None # Text of the question object being read
+        self._current_depth = 0
+        self.valid = 0
+        self.rejected = 0
+
+    def feed(self, chunk: str) -> list[dict]:
+        questions = []
+        for char in chunk:
+            if self._current is not None:
+                self._current.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if char == "{" and self._current is None and self._is_question_slot():
+                    self._current = [char]
+                    self._current_depth = len(self._stack) + 1
+                self._stack.append(char)
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if self._current is not None and len(self._stack) < self._current_depth:
+                    question = self._finish("".join(self._current))
+                    self._current = None
+                    if question:
+                        questions.append(question)
+        return questions
+
+    def close(self) -> list[dict]:
+        """End of stream: a question object still open was cut off and counts as rejected"""
+        if self._current is not None:
+            self.rejected += 1
+            self._current = None
+        return []
+
+    def _is_question_slot(self) -> bool:
+        return self._stack == ["{", "["] or self._stack == ["["]
+
+    def _finish(self, text: str) -> dict | None:
+        try:
+            question = validate_question(json.loads(text))
+        except ValueError:
+            question = None
+        if question:
+            self.valid += 1
+        else:
+            self.rejected += 1
+        return question
+
+class ParseYield:
+    """Parse yield across generation calls: valid questions divided by questions requested.
+
+    Only calls that ran to the end count; one cancelled once the quiz filled (or that failed)
+    is tallied under `abandoned`, since its unparsed tail says nothing about the parser.
+    `requested` includes the spare questions asked for to backfill rejects, also shown on
+    their own as `spare`.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.calls = 0
+        self.abandoned = 0
+        self.requested = 0
+        self.spare = 0
+        self.valid = 0
+        self.rejected = 0
+
+    def record(self, requested: int, valid: int, rejected: int, spare: int = 0):
+        with self._lock:
+            self.calls += 1
+            self.requested += requested + spare
+            self.spare += spare
+            self.valid += valid
+            self.rejected += rejected
+
+    def record_abandoned(self):
+        with self._lock:
+            self.abandoned += 1
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "abandoned": self.abandoned,
+            "requested": self.requested,
+            "spare": self.spare,
+            "valid": self.valid,
+            "rejected": self.rejected,
+            "parse_yield": round(self.valid / self.requested, 4) if self.requested else None
+        }
+
+# Map-reduce over long documents
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def split_into_sections(text: str, max_tokens: int) -> list[str]:
+    """Pack paragraphs into sections of at most `max_tokens` (estimated), splitting oversized paragraphs"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    sections = []
+    current = ""
+    for paragraph in text.split("\n\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        while len(paragraph) > max_chars:
+            cut = paragraph.rfind(" ", 0, max_chars)
+            cut = cut if cut > max_chars // 2 else max_chars
+            if current:
+                sections.append(current)
+                current = ""
+            sections.append(paragraph[:cut].strip())
+            paragraph = paragraph[cut:].strip()
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            sections.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        sections.append(current)
+    return sections
+
+def pick_sections(sections: list[str], limit: int) -> list[str]:
+    """Evenly spaced subset, so a capped number of map calls still spans the whole document"""
+    if len(sections) <= limit:
+        return sections
+    step = len(sections) / limit
+    return [sections[int(i * step)] for i in range(limit)]
+
+def section_quotas(mcq: int, n_sections: int) -> list[int]:
+    base, extra = divmod(mcq, n_sections)
+    return [base + (1 if i < extra else 0) for i in range(n_sections)]
+
+class QuestionSelector:
+    """Reduce step: accepts each section's questions up to its quota, dropping duplicates.
+
+    Questions past a section's quota are kept as surplus and used by finish() to backfill
+    sections that came up short.
+    """
+
+    def __init__(self, mcq: int, quotas: list[int]):
+        self.mcq = mcq
+        self.quotas = quotas
+        self.accepted: list[dict] = []
+        self._taken = [0] * len(quotas)
+        self._surplus: list[list[dict]] = [[] for _ in quotas]
+        self._seen: set[str] = set()
+
+    @property
+    def full(self) -> bool:
+        return len(self.accepted) >= self.mcq
+
+    def offer(self, section: int, question: dict) -> bool:
+        fingerprint = " ".join(question["question_text"].lower().split())
+        if fingerprint in self._seen:
+            return False
+        self._seen.add(fingerprint)
+
+        if not self.full and self._taken[section] < self.quotas[section]:
+            self._taken[section] += 1
+            self.accepted.append(question)
+            return True
+        self._surplus[section].append(question)
+        return False
+
+    def finish(self) -> list[dict]:
+        """Backfill from the surplus round-robin across sections; returns the questions added"""
+        added = []
+        while not self.full and any(self._surplus):
+            for surplus in self._surplus:
+                if surplus and not self.full:
+                    question = surplus.pop(0)
+                    self.accepted.append(question)
+                    added.append(question)
+        return added
@@ -0,0 +1,135 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+INTERACTIVE = 0 # A teacher is waiting on the response
+BULK = 1 # Queued generation jobs
+BACKGROUND = 2 # Housekeeping that should never delay a generation
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk", BACKGROUND: "background"}
+
+class LLMScheduler:
+    """Admission control in front of every Ollama call.
+
+    At most `max_concurrency` calls run at once. Waiters are served by priority, then by
+    per-user round so one user's many calls (e.g. a map-reduce fan-out) interleave with
+    everyone else's instead of running ahead of them, then in arrival order. Interactive
+    calls are rejected with 503 + Retry-After once `max_queue` calls are waiting; bulk and
+    background callers bound their own concurrency (job workers), so they always queue.
+    """
+
+    def __init__(self, max_concurrency: int = 2, max_queue: int = 32):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.running = 0
+        self._heap: list[tuple[int, int, int, asyncio.Future]] = [] # (priority, round, seq, waiter)
+        self._seq = itertools.count()
+        self._round = 0 # Round of the most recently dispatched waiter
+        self._user_rounds: dict[tuple[int, str], int] = {}
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_hold = 0.0
+        self.completed = 0
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, priority: int = INTERACTIVE):
+        """Hold one of the concurrency slots for the duration of the block"""
+        waited = await self._acquire(user_id, priority)
+        started = time.perf_counter()
+        try:
+            yield waited
+        finally:
+            self.total_hold += time.perf_counter() - started
+            self.completed += 1
+            self._release()
+
+    def check_admission(self, priority: int = INTERACTIVE):
+        """Fail fast, before any upload parsing, when an interactive call would be rejected anyway"""
+        if priority == INTERACTIVE and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise self._overloaded()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for *_, waiter in self._heap if not waiter.done())
+
+    def stats(self) -> dict:
+        by_priority = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _, waiter in self._heap:
+            if not waiter.done():
+                by_priority[PRIORITY_NAMES[priority]] += 1
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "queued": sum(by_priority.values()),
+            "queued_by_priority": by_priority,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 2) if self.admitted else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "avg_hold_ms": round(self.total_hold / self.completed * 1000, 2) if self.completed else 0.0
+        }
+
+    async def _acquire(self, user_id: str, priority: int) -> float:
+        enqueued_at = time.perf_counter()
+        if self.running < self.max_concurrency and not self.queued:
+            self.running += 1
+            self._admit(0.0)
+            return 0.0
+
+        self.check_admission(priority)
+        # A user's next call goes one round after their previous one, but never behind
+        # the round being served now, so idle users don't bank credit
+        user_key = (priority, user_id)
+        user_round = max(self._user_rounds.get(user_key, 0) + 1, self._round)
+        self._user_rounds[user_key] = user_round
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, user_round, next(self._seq), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed to us just as we were cancelled; pass it on
+                self._release()
+            else:
+                waiter.cancel()
+            raise
+
+        waited = time.perf_counter() - enqueued_at
+        self._admit(waited)
+        return waited
+
+    def _admit(self, waited: float):
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def _release(self):
+        # Hand the slot straight to the next live waiter so nobody can cut in between
+        while self._heap:
+            priority, user_round, _, waiter = heapq.heappop(self._heap)
+            if waiter.done():
+                continue
+            self._round = user_round
+            waiter.set_result(None)
+            return
+        self.running -= 1
+        if not self._heap:
+            self._user_rounds.clear()
+
+    def _overloaded(self) -> HTTPException:
+        avg_hold = self.total_hold / self.completed if self.completed else 30.0
+        retry_after = max(1, math.ceil(avg_hold * (self.queued + 1) / self.max_concurrency))
+        return HTTPException(
+            status_code=503,
+            detail="Quiz generation is at capacity, please retry shortly",
+            headers={"Retry-After": str(retry_after)}
+        )
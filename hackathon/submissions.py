@@ -0,0 +1,266 @@
+import asyncio
+import json
+import os
+import time
+from threading import Lock
+from typing import Awaitable, Callable
+
+from fastapi import HTTPException
+
+class SubmissionBuffer:
+    """Write-behind buffer for quiz submissions.
+
+    `submit` appends the row to a local append-only log and fsyncs it before returning, so
+    an acknowledged submission survives a crash. A background flusher hands rows to
+    `flush(rows)` in batches of up to `batch_size`, at the latest `flush_interval` seconds
+    after the oldest pending row arrived. After each successful batch the last flushed
+    sequence number is checkpointed; on start, anything past the checkpoint is replayed.
+    Delivery is at-least-once: a crash between a flush and its checkpoint replays that batch,
+    so `flush` should be idempotent (main.py upserts on a per-submission key).
+
+    A batch that fails is split in half and retried until the failing row is on its own, so
+    one bad row (a constraint violation, say) can't hold up everything queued behind it.
+    Single rows back off exponentially, and after `max_attempts` failures are moved to a
+    dead-letter file (`<log_path>.dead`) for inspection. The log file is owned by a single
+    app process.
+    """
+
+    def __init__(
+        self,
+        log_path: str,
+        flush: Callable[[list[dict]], Awaitable[None]],
+        batch_size: int = 200,
+        flush_interval: float = 0.5,
+        retry_delay: float = 2.0,
+        compact_bytes: int = 1024 * 1024,
+        max_attempts: int = 10,
+        max_retry_delay: float = 60.0
+    ):
+        self.log_path = log_path
+        self.checkpoint_path = log_path + ".checkpoint"
+        self.dead_letter_path = log_path + ".dead"
+        self._flush = flush
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.compact_bytes = compact_bytes
+        self.max_attempts = max_attempts
+        self.max_retry_delay = max_retry_delay
+        self._batch_limit = batch_size # Shrinks while bisecting a failing batch
+        self._isolate_until = 0 # Seqs up to here are retried in the smaller batches
+        self._attempts: dict[int, int] = {} # seq -> failed single-row attempts
+        self._log = None
+        self._lock = Lock()
+        self._last_seq = 0
+        self._flushed_seq = 0
+        self._pending: list[tuple[int, dict, float]] = [] # (seq, row, enqueued at), in seq order
+        self._writing: set[int] = set() # Seqs in _pending whose log write hasn't finished
+        self._wake = asyncio.Event()
+        self._flusher: asyncio.Task | None = None
+        self._stopping = False
+        self.submitted = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failures = 0
+        self.dead_lettered = 0
+        self.replayed = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    # Lifecycle
+    async def start(self):
+        pending = await asyncio.to_thread(self._open)
+        now = time.monotonic()
+        self._pending = [(seq, row, now) for seq, row in pending]
+        self.replayed = len(pending)
+        if pending:
+            print(f"Replaying {len(pending)} unflushed submission(s)")
+        self._flusher = asyncio.create_task(self._run())
+
+    async def shutdown(self, timeout: float = 10.0):
+        """Stop accepting submissions and flush what is pending; leftovers stay in the log"""
+        self._stopping = True
+        self._wake.set()
+        if self._flusher is not None:
+            try:
+                await asyncio.wait_for(self._flusher, timeout)
+            except asyncio.TimeoutError:
+                print(f"{len(self._pending)} submission(s) left in the log for the next start")
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    # Public API
+    async def submit(self, row: dict) -> int:
+        """Durably record a submission; returns its sequence number"""
+        if self._stopping:
+            raise HTTPException(status_code=503, detail="Server is shutting down, please retry shortly")
+        # The seq is taken and queued on the event loop, so _pending is always in seq order
+        # and a checkpoint never passes a seq whose log write is still in progress
+        self._last_seq += 1
+        seq = self._last_seq
+        self._pending.append((seq, row, time.monotonic()))
+        self._writing.add(seq)
+        write = asyncio.ensure_future(asyncio.to_thread(self._append, seq, row))
+        write.add_done_callback(lambda future: self._written(seq, future))
+        # Shielded: a cancelled request must not abandon a write that may already be in the log
+        await asyncio.shield(write)
+        self.submitted += 1
+        return seq
+
+    def _written(self, seq: int, write: asyncio.Future):
+        self._writing.discard(seq)
+        if write.cancelled() or write.exception() is not None:
+            # Never acknowledged, so it must not be flushed either
+            self._pending = [entry for entry in self._pending if entry[0] != seq]
+        self._wake.set()
+
+    def pending_rows(self) -> list[dict]:
+        """Acknowledged rows not yet written by `flush`"""
+        return [row for seq, row, _ in self._pending if seq not in self._writing]
+
+    def _ready(self) -> int:
+        """How many rows at the head of _pending are in the log and can be flushed"""
+        for index, (seq, _, _) in enumerate(self._pending):
+            if seq in self._writing:
+                return index
+        return len(self._pending)
+
+    def stats(self) -> dict:
+        oldest = self._pending[0][2] if self._pending else None
+        return {
+            "queue_depth": len(self._pending),
+            "oldest_pending_ms": round((time.monotonic() - oldest) * 1000, 2) if oldest else 0.0,
+            "submitted": self.submitted,
+            "replayed": self.replayed,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "failures": self.failures,
+            "dead_lettered": self.dead_lettered,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "batch_size": self.batch_size,
+            "flush_interval_seconds": self.flush_interval
+        }
+
+    # Flusher
+    async def _run(self):
+        while True:
+            ready = self._ready()
+            if not ready:
+                if self._stopping and not self._pending:
+                    return
+                # Nothing pending, or the head row's log write is still in progress
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            # Wait for a full batch, the oldest row's deadline, or shutdown
+            remaining = self._pending[0][2] + self.flush_interval - time.monotonic()
+            if ready < self.batch_size and remaining > 0 and not self._stopping:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            if self._pending[0][0] > self._isolate_until:
+                self._batch_limit = self.batch_size
+            # Always a prefix of _pending, so every lower seq has been flushed when it is checkpointed
+            batch = self._pending[:min(ready, self._batch_limit)]
+            started = time.perf_counter()
+            try:
+                await self._flush([row for _, row, _ in batch])
+            except Exception as e:
+                self.failures += 1
+                print(f"Submission flush of {len(batch)} row(s) failed: {e}")
+                if self._stopping:
+                    return
+                if len(batch) > 1:
+                    # Bisect towards the row that fails
+                    self._batch_limit = len(batch) // 2
+                    self._isolate_until = max(self._isolate_until, batch[-1][0])
+                    continue
+                seq = batch[0][0]
+                attempts = self._attempts.get(seq, 0) + 1
+                if attempts < self.max_attempts:
+                    self._attempts[seq] = attempts
+                    await asyncio.sleep(min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay))
+                    continue
+                await asyncio.to_thread(self._dead_letter, batch[0], str(e))
+                self._attempts.pop(seq, None)
+                del self._pending[:1]
+                self.dead_lettered += 1
+                print(f"Submission {seq} failed {attempts} times; moved to {self.dead_letter_path}")
+                await asyncio.to_thread(self._checkpoint, seq)
+                continue
+
+            elapsed = (time.perf_counter() - started) * 1000
+            del self._pending[:len(batch)]
+            for seq, _, _ in batch:
+                self._attempts.pop(seq, None)
+            self.flushes += 1
+            self.flushed_rows += len(batch)
+            self.last_flush_ms = elapsed
+            self.total_flush_ms += elapsed
+            self.max_flush_ms = max(self.max_flush_ms, elapsed)
+            await asyncio.to_thread(self._checkpoint, batch[-1][0])
+
+    # Log files
+    def _open(self) -> list[tuple[int, dict]]:
+        if os.path.dirname(self.log_path):
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+        try:
+            with open(self.checkpoint_path) as f:
+                self._flushed_seq = int(f.read().strip() or 0)
+        except FileNotFoundError:
+            self._flushed_seq = 0
+
+        pending = []
+        self._last_seq = self._flushed_seq
+        if os.path.exists(self.log_path):
+            with open(self.log_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn final line from a crash mid-write was never acknowledged
+                        continue
+                    self._last_seq = max(self._last_seq, entry["seq"])
+                    if entry["seq"] > self._flushed_seq:
+                        pending.append((entry["seq"], entry["row"]))
+        self._log = open(self.log_path, "a")
+        return pending
+
+    def _append(self, seq: int, row: dict):
+        # Concurrent writes may land out of seq order; replay goes by seq, not position
+        with self._lock:
+            self._log.write(json.dumps({"seq": seq, "row": row}) + "\n")
+            self._log.flush()
+            os.fsync(self._log.fileno())
+
+    def _dead_letter(self, entry: tuple[int, dict, float], error: str):
+        seq, row, _ = entry
+        with open(self.dead_letter_path, "a") as f:
+            f.write(json.dumps({"seq": seq, "row": row, "error": error, "at": time.time()}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _checkpoint(self, seq: int):
+        with self._lock:
+            self._flushed_seq = seq
+            tmp_path = self.checkpoint_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(str(seq))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.checkpoint_path)
+
+            # Everything written so far is flushed, so the log can start over
+            if self._last_seq == seq and not self._writing and self._log is not None and self._log.tell() >= self.compact_bytes:
+                self._log.truncate(0)
+                self._log.seek(0)
@@ -0,0 +1,126 @@
+import math
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from threading import Lock
+
+@dataclass(frozen=True)
+class ModelTier:
+    model: str
+    max_tokens: float # Largest extracted text (estimated tokens) this tier handles at normal load
+    max_questions: float # Most questions this tier handles at normal load
+    seconds_per_question: float # Starting latency estimate, replaced by observations
+
+@dataclass(frozen=True)
+class ModelChoice:
+    model: str
+    reason: str
+    estimated_seconds: float
+
+class GenerationClock:
+    """Wall time during which at least one of a request's model calls held a scheduler slot.
+
+    Queue waits are left out, since `ModelSelector.estimate` adds the queue separately;
+    sections generating in parallel count once, as the request's own wall time.
+    """
+
+    def __init__(self):
+        self._active = 0
+        self._since = 0.0
+        self._seconds = 0.0
+
+    @contextmanager
+    def running(self):
+        if not self._active:
+            self._since = time.perf_counter()
+        self._active += 1
+        try:
+            yield
+        finally:
+            self._active -= 1
+            if not self._active:
+                self._seconds += time.perf_counter() - self._since
+
+    @property
+    def seconds(self) -> float:
+        return self._seconds + (time.perf_counter() - self._since if self._active else 0.0)
+
+class ModelSelector:
+    """Picks the model for a generation from the document size, question count and load.
+
+    Tiers are ordered smallest to largest; the last one must accept anything. A request goes
+    to the smallest tier whose limits fit. When `queue_depth` reaches `busy_queue` the limits
+    stretch by `busy_factor`, trading some quality for throughput before the queue rejects
+    anyone. With a latency budget, the largest tier no bigger than that choice whose
+    estimated time fits is used instead (the smallest if none does). Estimates start at each
+    tier's `seconds_per_question` and follow observed generations via an EWMA.
+    """
+
+    def __init__(self, tiers: list[ModelTier], concurrency: int, busy_queue: int = 8, busy_factor: float = 2.0, alpha: float = 0.2):
+        if not tiers:
+            raise ValueError("ModelSelector needs at least one tier")
+        self.tiers = tiers
+        self.concurrency = max(1, concurrency)
+        self.busy_queue = busy_queue
+        self.busy_factor = busy_factor
+        self.alpha = alpha
+        self._lock = Lock()
+        self._seconds_per_question = {tier.model: tier.seconds_per_question for tier in tiers}
+        self.chosen: dict[str, int] = {}
+        self.reasons: dict[str, int] = {}
+
+    def estimate(self, model: str, questions: int, queue_depth: int = 0) -> float:
+        """Rough wall time: generation itself, plus the queue ahead of it draining"""
+        generation = self._seconds_per_question[model] * max(questions, 1)
+        return generation * (1 + queue_depth / self.concurrency)
+
+    def choose(self, tokens: int, questions: int, queue_depth: int = 0, latency_budget: float | None = None) -> ModelChoice:
+        busy = queue_depth >= self.busy_queue
+        scale = self.busy_factor if busy else 1.0
+        index = next(
+            (i for i, tier in enumerate(self.tiers) if tokens <= tier.max_tokens * scale and questions <= tier.max_questions * scale),
+            len(self.tiers) - 1
+        )
+        reason = "busy" if busy and index < self._fit_index(tokens, questions) else "size"
+
+        if latency_budget is not None:
+            fitting = [i for i in range(index + 1) if self.estimate(self.tiers[i].model, questions, queue_depth) <= latency_budget]
+            budget_index = fitting[-1] if fitting else 0
+            if budget_index < index:
+                index, reason = budget_index, "latency_budget"
+
+        model = self.tiers[index].model
+        with self._lock:
+            self.chosen[model] = self.chosen.get(model, 0) + 1
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        return ModelChoice(model, reason, round(self.estimate(model, questions, queue_depth), 2))
+
+    def record(self, model: str, questions: int, seconds: float):
+        """Fold an observed generation time (excluding queue waits) into the model's estimate"""
+        if questions < 1 or model not in self._seconds_per_question:
+            return
+        with self._lock:
+            current = self._seconds_per_question[model]
+            self._seconds_per_question[model] = current + self.alpha * (seconds / questions - current)
+
+    def _fit_index(self, tokens: int, questions: int) -> int:
+        return next(
+            (i for i, tier in enumerate(self.tiers) if tokens <= tier.max_tokens and questions <= tier.max_questions),
+            len(self.tiers) - 1
+        )
+
+    def stats(self) -> dict:
+        return {
+            "tiers": [
+                {
+                    "model": tier.model,
+                    "max_tokens": None if math.isinf(tier.max_tokens) else tier.max_tokens,
+                    "max_questions": None if math.isinf(tier.max_questions) else tier.max_questions,
+                    "seconds_per_question": round(self._seconds_per_question[tier.model], 3)
+                }
+                for tier in self.tiers
+            ],
+            "chosen": dict(self.chosen),
+            "reasons": dict(self.reasons),
+            "busy_queue": self.busy_queue
+        }
@@ -0,0 +1,207 @@
+import hashlib
+import io
+import json
+import mmap
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from fastapi import HTTPException, UploadFile
+
+class IngestedUpload:
+    """An upload read once in chunks: hashed on the way in, held in memory when small, on disk otherwise"""
+
+    def __init__(self, filename: str, size: int, sha256: str | None, buffer: bytearray | None = None, path: str | None = None, owns_path: bool = True):
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+        self._buffer = buffer
+        self.path = path
+        self._owns_path = owns_path
+
+    @classmethod
+    def from_path(cls, path: str, filename: str, sha256: str | None = None) -> "IngestedUpload":
+        """Wrap a file that is already on disk (e.g. a queued job's upload); the caller keeps ownership"""
+        return cls(filename, os.path.getsize(path), sha256, path=path, owns_path=False)
+
+    @property
+    def in_memory(self) -> bool:
+        return self.path is None
+
+    def open(self):
+        """A readable binary file object over the upload (spooled uploads are read straight from disk)"""
+        if self.in_memory:
+            return io.BytesIO(memoryview(self._buffer))
+        return open(self.path, "rb")
+
+    @contextmanager
+    def mapped(self):
+        """Yield a zero-copy buffer: a memoryview for in-memory uploads, an mmap for spooled ones"""
+        if self.in_memory:
+            yield memoryview(self._buffer)
+            return
+        if self.size == 0:
+            yield b""
+            return
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+    def as_path(self, spool_dir: str | None = None) -> str:
+        """Path to the upload on disk, writing the in-memory buffer out first if needed"""
+        if self.in_memory:
+            fd, path = tempfile.mkstemp(prefix="upload-", suffix=os.path.splitext(self.filename)[1], dir=spool_dir)
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._buffer)
+            self._buffer = None
+            self.path = path
+            self._owns_path = True
+        return self.path
+
+    def persist_to(self, path: str):
+        """Hand the upload's bytes over to `path` (moved when spooled, written when in memory)"""
+        if self.in_memory:
+            with open(path, "wb") as f:
+                f.write(self._buffer)
+        elif self._owns_path:
+            shutil.move(self.path, path)
+            # The bytes now belong to `path`; this object is spent
+            self.path = None
+            self._buffer = bytearray()
+        else:
+            shutil.copyfile(self.path, path)
+
+    def cleanup(self):
+        if self.path and self._owns_path:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        self._buffer = None
+
+async def ingest_upload(
+    file: UploadFile,
+    max_bytes: int,
+    spool_threshold: int,
+    spool_dir: str | None = None,
+    chunk_size: int = 1024 * 1024
+) -> IngestedUpload:
+    """Read an UploadFile chunk by chunk, hashing it and enforcing `max_bytes` as it arrives.
+
+    Uploads up to `spool_threshold` bytes stay in memory; anything larger goes to a temp file.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise _too_large(max_bytes)
+
+    digest = hashlib.sha256()
+    buffer = bytearray()
+    spool = None
+    size = 0
+    try:
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise _too_large(max_bytes)
+            digest.update(chunk)
+
+            if spool is None and size > spool_threshold:
+                if spool_dir:
+                    os.makedirs(spool_dir, exist_ok=True)
+                spool = tempfile.NamedTemporaryFile(
+                    prefix="upload-", suffix=os.path.splitext(file.filename)[1], dir=spool_dir, delete=False
+                )
+                spool.write(buffer)
+                buffer = None
+            if spool is not None:
+                spool.write(chunk)
+            else:
+                buffer.extend(chunk)
+    except BaseException:
+        if spool is not None:
+            spool.close()
+            os.unlink(spool.name)
+        raise
+
+    if spool is not None:
+        spool.close()
+        return IngestedUpload(file.filename, size, digest.hexdigest(), path=spool.name)
+    return IngestedUpload(file.filename, size, digest.hexdigest(), buffer=buffer)
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File too large. The maximum upload size is {max_bytes // (1024 * 1024)} MB")
+
+class UploadSizeLimitMiddleware:
+    """Rejects oversized request bodies on upload routes before they are parsed.
+
+    Checks Content-Length up front and counts streamed bytes for chunked bodies, so a huge
+    upload is cut off instead of being spooled in full by the multipart parser. Register it
+    before CORSMiddleware so the rejections still carry CORS headers. `max_upload_bytes` is
+    the file limit quoted in the 413; the body limit adds headroom for multipart framing.
+    """
+
+    def __init__(self, app, max_body_bytes: int, path_prefixes: tuple[str, ...], max_upload_bytes: int | None = None):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+        self.max_upload_bytes = max_upload_bytes or max_body_bytes
+        self.path_prefixes = path_prefixes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    length = int(value)
+                except ValueError:
+                    await self._send_error(send, 400, "Invalid Content-Length header")
+                    return
+                if length > self.max_body_bytes:
+                    await self._reject(send)
+                    return
+                break
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    raise _BodyTooLarge()
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            if not response_started:
+                await self._reject(send)
+
+    async def _reject(self, send):
+        await self._send_error(send, 413, f"Request body too large. The maximum upload size is {self.max_upload_bytes // (1024 * 1024)} MB")
+
+    async def _send_error(self, send, status: int, detail: str):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+class _BodyTooLarge(HTTPException):
+    # An HTTPException so FastAPI's form parsing re-raises it as a 413 instead of a generic 400
+    def __init__(self):
+        super().__init__(status_code=413, detail="Request body too large")
@@ -0,0 +1,114 @@
+import asyncio
+import time
+from datetime import datetime
+
+from ollama_pool import OllamaPool
+
+def parse_keep_alive(value: str) -> str | float:
+    """Ollama takes either a duration ("30m", "2h") or seconds, with a negative number meaning forever"""
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def parse_range(value: str, lowest: int, highest: int) -> tuple[int, int]:
+    """"7-19" -> (7, 19); an empty value covers the whole range"""
+    if not value.strip():
+        return lowest, highest
+    start, _, end = value.partition("-")
+    start, end = int(start), int(end or start)
+    if not lowest <= start <= end <= highest:
+        raise ValueError(f"Expected a range within {lowest}-{highest}, got {value!r}")
+    return start, end
+
+class ModelWarmer:
+    """Keeps the quiz models (one per tier) loaded on the Ollama hosts.
+
+    `start` preloads the models in the background (startup is not held up by a load that can
+    take a minute), then every `interval` seconds within business hours it pings the hosts
+    again so Ollama's keep_alive timer never runs out while teachers are likely to be
+    working. Outside those hours the models are left to unload. Pings bypass the LLM
+    scheduler: a load can take a minute per host, and holding a generation slot for it
+    would stall real requests, while an empty prompt generates nothing once it is loaded.
+    """
+
+    def __init__(
+        self,
+        pool: OllamaPool,
+        models: list[str],
+        interval: float = 300.0,
+        hours: tuple[int, int] = (0, 23),
+        weekdays: tuple[int, int] = (0, 6)
+    ):
+        self.pool = pool
+        self.models = list(dict.fromkeys(models)) # Deduplicated, in tier order
+        self.interval = interval
+        self.hours = hours # Inclusive local hours, e.g. (7, 19) is 07:00-19:59
+        self.weekdays = weekdays # Inclusive, Monday is 0
+        self._task: asyncio.Task | None = None
+        self.pings = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_ping: float | None = None
+        self.last_ping_ms = 0.0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def in_business_hours(self, now: datetime | None = None) -> bool:
+        now = now or datetime.now()
+        return self.weekdays[0] <= now.weekday() <= self.weekdays[1] and self.hours[0] <= now.hour <= self.hours[1]
+
+    def resident(self) -> dict[str, list[str]]:
+        """Hosts each model is loaded on"""
+        return {model: self.pool.resident(model) for model in self.models}
+
+    def ready(self) -> bool:
+        """Every model is resident on at least one healthy host"""
+        return all(self.resident().values())
+
+    async def warm(self) -> dict[str, int]:
+        """Ping every model; returns how many hosts each one is loaded on"""
+        started = time.perf_counter()
+        warmed = {}
+        for model in self.models:
+            warmed[model] = await self.pool.warm(model)
+        self.pings += 1
+        self.failures += sum(count == 0 for count in warmed.values())
+        self.last_ping = time.time()
+        self.last_ping_ms = (time.perf_counter() - started) * 1000
+        return warmed
+
+    async def _run(self):
+        # Always preload after a deploy, whatever the hour: the first request shouldn't pay for it
+        business_hours = True
+        while True:
+            if business_hours:
+                try:
+                    await self.warm()
+                except Exception as e:
+                    self.failures += 1
+                    print(f"Keep-warm ping for {', '.join(self.models)} failed: {e}")
+            else:
+                self.skipped += 1
+            await asyncio.sleep(self.interval)
+            business_hours = self.in_business_hours()
+
+    def stats(self) -> dict:
+        return {
+            "models": self.models,
+            "ready": self.ready(),
+            "resident_on": self.resident(),
+            "in_business_hours": self.in_business_hours(),
+            "pings": self.pings,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "last_ping_ms": round(self.last_ping_ms, 2),
+            "seconds_since_ping": round(time.time() - self.last_ping, 1) if self.last_ping else None
+        }